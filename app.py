@@ -1,61 +1,92 @@
 
-from flask import Flask
+from flask import Flask, request, Response, abort
 from config import Config
 from models import db, Admin
 from auth import auth_bp
 from dashboard import dashboard_bp
-from linebot_app import line_bp
+from linebot_app import line_bp, shutdown_background_workers
 from utils import hash_password
+from plate_search import normalize_plate
+from migrations import check_schema, upgrade, current_version, LATEST_VERSION
+from dbpool import engine_options, install_sqlite_pragmas
+from metrics import metrics, init_metrics
+from sqltrace import install_query_tracing
+from plate_fuzzy import plate_index_reload
+import atexit
+import click
+from sqlalchemy.exc import IntegrityError
 import os
 
-def auto_migrate(app):
-    from sqlalchemy import inspect
-    with app.app_context():
-        engine = db.engine
-        insp = inspect(engine)
-        if "vehicles" in insp.get_table_names():
-            cols = {c['name'] for c in insp.get_columns("vehicles")}
-            to_add = []
-            if "color" not in cols:
-                to_add.append(("color", "VARCHAR(64)"))
-            if "vin" not in cols:
-                to_add.append(("vin", "VARCHAR(64)"))
-            if "recorded_date" not in cols:
-                to_add.append(("recorded_date", "DATE"))
-            if to_add:
-                dialect = engine.dialect.name  # 'sqlite', 'mysql', 'postgresql'
-                for name, dtype in to_add:
-                    if dialect == "sqlite":
-                        ddl = f"ALTER TABLE vehicles ADD COLUMN {name} {dtype};"
-                    else:
-                        ddl = f"ALTER TABLE vehicles ADD COLUMN {name} {dtype}"
-                        if dialect == "mysql":
-                            ddl += " NULL"
-                        ddl += ";"
-                    try:
-                        with engine.connect() as conn:
-                            conn.exec_driver_sql(ddl)
-                    except Exception:
-                        # คอลัมน์อาจถูกเพิ่มไว้แล้ว หรือสิทธิ์ไม่พอ — ข้ามไป
-                        pass
-
-        if "line_users" in insp.get_table_names():
-            cols_u = {c['name'] for c in insp.get_columns("line_users")}
-            if "display_name" not in cols_u:
-                try:
-                    with engine.connect() as conn:
-                        conn.exec_driver_sql("ALTER TABLE line_users ADD COLUMN display_name VARCHAR(128);")
-                except Exception:
-                    pass
-
-        if "line_groups" in insp.get_table_names():
-            cols_g = {c['name'] for c in insp.get_columns("line_groups")}
-            if "display_name" not in cols_g:
-                try:
-                    with engine.connect() as conn:
-                        conn.exec_driver_sql("ALTER TABLE line_groups ADD COLUMN display_name VARCHAR(128);")
-                except Exception:
-                    pass
+def backfill_plate_keys(batch_size: int = 2000) -> int:
+    """เติม vehicles.plate_key ให้แถวเดิมทีละชุด (เรียงตาม id) คืนจำนวนแถวที่อัปเดต"""
+    from sqlalchemy import select, update, bindparam
+    from models import Vehicle
+    from plate_search import normalize_plate
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Vehicle.id, Vehicle.license_plate, Vehicle.plate_key)
+            .where(Vehicle.id > last_id)
+            .order_by(Vehicle.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        changed = []
+        for r in rows:
+            key = normalize_plate(r.license_plate) or None
+            if key != r.plate_key:
+                changed.append({"vid": r.id, "key": key})
+        if changed:
+            db.session.execute(
+                update(Vehicle.__table__)
+                .where(Vehicle.__table__.c.id == bindparam("vid"))
+                .values(plate_key=bindparam("key")),
+                changed,
+            )
+            db.session.commit()
+            total += len(changed)
+    return total
+
+def assign_dedupe_keys(with_vin: bool = False, batch_size: int = 2000) -> int:
+    """
+    กำหนด dedupe_key ให้แถวเดิม (ที่ยังว่าง) เพื่อให้อัปโหลดแบบ upsert อัปเดตแถวเดิมได้
+    แถวใหม่สุด (id มากสุด) ของแต่ละคีย์ได้คีย์ไป แถวซ้ำที่เก่ากว่าคงเป็น NULL (ไม่ลบข้อมูล)
+    """
+    from sqlalchemy import select, update, bindparam
+    from models import Vehicle
+    from vehicle_import import make_dedupe_key
+
+    seen = set(db.session.execute(select(Vehicle.dedupe_key).where(Vehicle.dedupe_key.isnot(None))).scalars())
+    total = 0
+    last_id = None
+    while True:
+        q = select(Vehicle.id, Vehicle.plate_key, Vehicle.license_plate, Vehicle.vin).where(Vehicle.dedupe_key.is_(None))
+        if last_id is not None:
+            q = q.where(Vehicle.id < last_id)
+        rows = db.session.execute(q.order_by(Vehicle.id.desc()).limit(batch_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        changed = []
+        for r in rows:
+            key = make_dedupe_key(r.plate_key or normalize_plate(r.license_plate), r.vin, with_vin)
+            if key and key not in seen:
+                seen.add(key)
+                changed.append({"vid": r.id, "key": key})
+        if changed:
+            db.session.execute(
+                update(Vehicle.__table__)
+                .where(Vehicle.__table__.c.id == bindparam("vid"))
+                .values(dedupe_key=bindparam("key")),
+                changed,
+            )
+            db.session.commit()
+            total += len(changed)
+    return total
 
 def ensure_initial_admin():
     # สร้างแอดมินอัตโนมัติรอบแรก ถ้ายังไม่มีผู้ดูแลระบบเลย
@@ -65,26 +96,109 @@ def ensure_initial_admin():
         return
     if Admin.query.count() == 0:
         a = Admin(username=username, password=hash_password(password))
-        db.session.add(a); db.session.commit()
+        db.session.add(a)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # worker อื่นบูตพร้อมกันและสร้างไปแล้ว
 
 def create_app():
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config.from_object(Config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, wal=app.config["SQLITE_WAL"],
+                               busy_timeout_ms=app.config["SQLITE_BUSY_TIMEOUT_MS"])
+        if app.config.get("SQL_TRACE_ENABLED"):
+            install_query_tracing(app, db.engine)
 
+    # เทียบเลขเวอร์ชัน schema อย่างเดียว (DDL อยู่ใน migrations.py / คำสั่ง flask migrate)
+    check_schema(app)
     with app.app_context():
-        db.create_all()
         ensure_initial_admin()
-    auto_migrate(app)
+
+    init_metrics(app)
+    # ลำดับปิดโปรเซส: คิว LINE -> audit writer -> metrics (ที่เดียว ไม่ขึ้นกับว่าส่วนไหนถูกใช้ก่อน)
+    atexit.register(shutdown_background_workers)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(line_bp)
 
+    @app.cli.command("migrate")
+    @click.option("--to", "target", type=int, default=None, help="เวอร์ชันเป้าหมาย (ค่าเริ่มต้น = ล่าสุด)")
+    def migrate_cmd(target):
+        """ปรับ schema ฐานข้อมูลเป็นเวอร์ชันล่าสุด (รันเฉพาะขั้นที่ยังไม่เคยรัน)"""
+        applied = upgrade(db.engine, target)
+        print(f"Applied migrations: {', '.join(map(str, applied)) or '-'}; "
+              f"schema version {current_version(db.engine)} (latest {LATEST_VERSION}).")
+
+    @app.cli.command("schema-version")
+    def schema_version_cmd():
+        """แสดงเวอร์ชัน schema ปัจจุบันของฐานข้อมูล"""
+        print(f"schema version {current_version(db.engine)} (latest {LATEST_VERSION}).")
+
+    @app.cli.command("backfill-plate-keys")
+    def backfill_plate_keys_cmd():
+        """เติมคีย์ค้นหาทะเบียน (plate_key) ให้ข้อมูลรถเดิม"""
+        n = backfill_plate_keys()
+        if n:
+            plate_index_reload()
+        print(f"Updated plate_key for {n} vehicles.")
+
+    @app.cli.command("assign-dedupe-keys")
+    @click.option("--with-vin", is_flag=True, help="ใช้ทะเบียน + เลขตัวถังเป็นคีย์")
+    def assign_dedupe_keys_cmd(with_vin):
+        """กำหนดคีย์ upsert ให้ข้อมูลรถเดิม (แถวใหม่สุดของแต่ละทะเบียน)"""
+        n = assign_dedupe_keys(with_vin=with_vin)
+        print(f"Assigned dedupe_key to {n} vehicles.")
+
+    @app.cli.command("rebuild-search-stats")
+    @click.option("--since", default=None, help="วันเริ่มต้น YYYY-MM-DD (เวลาไทย); ค่าเริ่มต้น = วันแรกที่มีใน audit_logs")
+    def rebuild_search_stats_cmd(since):
+        """คำนวณตารางสรุปการค้นหารายวันใหม่จาก audit_logs"""
+        from datetime import date
+        from search_stats import rebuild_search_stats
+        n = rebuild_search_stats(date.fromisoformat(since) if since else None)
+        print(f"Rebuilt search_daily_stats: {n} rows.")
+
+    @app.cli.command("archive-audit-logs")
+    @click.option("--days", type=int, default=None, help="เก็บไว้กี่วัน (ค่าเริ่มต้น AUDIT_RETENTION_DAYS)")
+    @click.option("--out", "out_dir", default=None, help="โฟลเดอร์ปลายทาง (ค่าเริ่มต้น AUDIT_ARCHIVE_DIR)")
+    @click.option("--batch", "batch_size", type=int, default=5000, help="จำนวนแถวที่ลบต่อ transaction")
+    @click.option("--format", "fmt", type=click.Choice(["jsonl", "csv"]), default="jsonl")
+    @click.option("--pause-ms", type=int, default=0, help="พักระหว่างชุด (มิลลิวินาที)")
+    @click.option("--dry-run", is_flag=True, help="นับจำนวนแถวที่จะย้ายเท่านั้น")
+    def archive_audit_logs_cmd(days, out_dir, batch_size, fmt, pause_ms, dry_run):
+        """ย้าย audit_logs เก่าไปไฟล์ .gz รายเดือน แล้วลบออกจากฐานข้อมูลทีละชุด"""
+        from audit_archive import archive_audit_logs
+        days = app.config.get("AUDIT_RETENTION_DAYS", 0) if days is None else days
+        if days <= 0:
+            print("Retention disabled (set --days or AUDIT_RETENTION_DAYS).")
+            return
+        stats = archive_audit_logs(days, out_dir or app.config.get("AUDIT_ARCHIVE_DIR", "archive"),
+                                   batch_size=batch_size, fmt=fmt, pause_ms=pause_ms, dry_run=dry_run)
+        print(f"cutoff (UTC) {stats['cutoff_utc']}: {stats['candidates']} rows older than {days} days; "
+              f"archived {stats['archived']} in {stats['batches']} batches -> {', '.join(stats['files']) or '-'}")
+
     @app.route("/healthz")
     def healthz():
         return {"status": "ok"}
 
+    @app.before_request
+    def _start_metrics_flusher():
+        metrics.ensure_flusher()
+
+    @app.route("/metrics")
+    def metrics_view():
+        if not app.config.get("METRICS_ENABLED", True):
+            abort(404)
+        token = app.config.get("METRICS_TOKEN", "")
+        if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+            abort(401)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
     return app
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import csv
+import gzip
+import json
+import os
+import time as _time
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select, delete, func
+
+from models import db, AuditLog
+from dbutil import BKK_UTC_OFFSET_HOURS
+from search_stats import rebuild_search_stats
+
+ARCHIVE_COLUMNS = [c.name for c in AuditLog.__table__.columns]
+FORMATS = ("jsonl", "csv")
+
+
+def archive_cutoff(retention_days: int, today: date | None = None) -> tuple[date, datetime]:
+    """
+    คืน (วันแรกที่เก็บไว้ (เวลาไทย), เวลาตัด UTC)
+    ตัดที่เที่ยงคืนเวลาไทยเสมอ เพื่อให้ archive ทีละทั้งวัน และตารางสรุปรายวันคำนวณใหม่ได้ถูกต้อง
+    """
+    if today is None:
+        today = (datetime.utcnow() + timedelta(hours=BKK_UTC_OFFSET_HOURS)).date()
+    keep_from = today - timedelta(days=retention_days)
+    cutoff_utc = datetime.combine(keep_from, time.min) - timedelta(hours=BKK_UTC_OFFSET_HOURS)
+    return keep_from, cutoff_utc
+
+
+def _row_dict(log: AuditLog) -> dict:
+    d = {}
+    for c in ARCHIVE_COLUMNS:
+        v = getattr(log, c)
+        d[c] = v.isoformat() if isinstance(v, datetime) else v
+    return d
+
+
+def _partition(when: datetime) -> str:
+    # ไฟล์ละเดือน (เวลาไทย)
+    local = when + timedelta(hours=BKK_UTC_OFFSET_HOURS)
+    return f"{local.year:04d}-{local.month:02d}"
+
+
+def _append(out_dir: str, fmt: str, month: str, rows: list[dict]):
+    path = os.path.join(out_dir, f"audit_logs-{month}.{fmt}.gz")
+    new_file = not os.path.exists(path)
+    # gzip รองรับการต่อหลาย member ในไฟล์เดียว จึงเปิดแบบ append ได้
+    with gzip.open(path, "at", encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        else:
+            w = csv.DictWriter(f, fieldnames=ARCHIVE_COLUMNS)
+            if new_file:
+                w.writeheader()
+            w.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_audit_logs(retention_days: int, out_dir: str, batch_size: int = 5000, fmt: str = "jsonl",
+                       pause_ms: int = 0, dry_run: bool = False) -> dict:
+    """
+    ย้าย audit_logs ที่เก่ากว่า retention_days วัน ไปเป็นไฟล์บีบอัดรายเดือน แล้วลบทีละ batch_size แถว
+    (commit ทุกชุด ไม่ล็อกตารางนาน) — ก่อนลบจะคำนวณตารางสรุปรายวันของช่วงนั้นให้ครบ
+    ถ้าโปรเซสหยุดกลางคัน ชุดล่าสุดอาจถูกเขียนลงไฟล์ซ้ำ (at-least-once) แต่ไม่มีแถวหาย
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown archive format: {fmt}")
+    keep_from, cutoff = archive_cutoff(retention_days)
+    pending = db.session.execute(select(func.count(AuditLog.id)).where(AuditLog.when < cutoff)).scalar() or 0
+    stats = {"cutoff_utc": cutoff.isoformat(), "candidates": pending, "archived": 0, "batches": 0, "files": set()}
+    if dry_run or not pending:
+        stats["files"] = []
+        return stats
+
+    # ให้ตารางสรุปรายวันครอบคลุมวันที่จะลบ (คำนวณจากข้อมูลดิบที่ยังครบอยู่)
+    rebuild_search_stats(until=keep_from - timedelta(days=1))
+
+    os.makedirs(out_dir, exist_ok=True)
+    while True:
+        logs = (
+            AuditLog.query.filter(AuditLog.when < cutoff)
+            .order_by(AuditLog.when, AuditLog.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not logs:
+            break
+        by_month: dict[str, list[dict]] = {}
+        for log in logs:
+            by_month.setdefault(_partition(log.when), []).append(_row_dict(log))
+        for month, rows in by_month.items():
+            _append(out_dir, fmt, month, rows)
+            stats["files"].add(f"audit_logs-{month}.{fmt}.gz")
+
+        ids = [log.id for log in logs]
+        db.session.execute(delete(AuditLog).where(AuditLog.id.in_(ids)))
+        db.session.commit()
+        db.session.expunge_all()
+        stats["archived"] += len(ids)
+        stats["batches"] += 1
+        if pause_ms:
+            _time.sleep(pause_ms / 1000.0)
+
+    stats["files"] = sorted(stats["files"])
+    return stats
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import insert
+
+from models import db, AuditLog
+from search_stats import bump_search_stats
+
+log = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """
+    บัฟเฟอร์ AuditLog แล้วเขียนเป็น multi-row INSERT ครั้งเดียว
+    - flush เมื่อครบ flush_rows แถว หรือทุก flush_ms มิลลิวินาที (thread เบื้องหลัง)
+    - บัฟเฟอร์จำกัดขนาด max_rows; เมื่อเต็มใช้นโยบาย overflow:
+        "flush" = ผู้เรียก flush เองทันที (ไม่ทิ้งข้อมูล แต่รอ DB)
+        "drop"  = ทิ้งแถวใหม่ และนับไว้ใน dropped
+    - เขียนไม่สำเร็จ: นับใน failed แล้วใส่คืนบัฟเฟอร์ให้ลองใหม่อีกครั้งเดียว (เท่าที่ที่ว่างพอ)
+      ล้มซ้ำหรือบัฟเฟอร์เต็ม -> ทิ้งและนับใน dropped
+    - close() flush ที่เหลือทั้งหมด (เรียกจาก shutdown_background_workers ตอนปิดโปรเซส)
+      แถวที่เข้ามาหลังปิดแล้วจะเขียนตรงทันที ไม่ค้างในบัฟเฟอร์
+    """
+
+    def __init__(self, app, flush_rows: int = 100, flush_ms: int = 500, max_rows: int = 10000,
+                 overflow: str = "flush"):
+        self.app = app
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = max(10, flush_ms) / 1000.0
+        self.max_rows = max(self.flush_rows, max_rows)
+        self.overflow = overflow
+        self._buf: deque[dict] = deque()
+        self._retry: list[dict] = []  # แถวที่เขียนไม่สำเร็จมาแล้วหนึ่งครั้ง
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, row: dict):
+        if not self._closed:
+            self._ensure_started()
+        with self._cond:
+            closed = self._closed
+            if closed:
+                full = False
+            elif len(self._buf) >= self.max_rows:
+                if self.overflow == "drop":
+                    self.dropped += 1
+                    return
+                full = True
+            else:
+                full = False
+            if not closed:
+                self._buf.append(row)
+                if len(self._buf) >= self.flush_rows:
+                    self._cond.notify()
+        if closed:
+            self._write_now([row])
+        elif full:
+            self.flush()
+
+    def _write_now(self, rows: list[dict]):
+        # หลัง close(): ไม่มี thread เบื้องหลังแล้ว จึงเขียนตรงในผู้เรียก
+        with self.app.app_context():
+            try:
+                write_audit_rows(rows)
+                self.written += len(rows)
+            except Exception:
+                db.session.rollback()
+                self.failed += len(rows)
+                self.dropped += len(rows)
+                log.exception("audit insert after close failed (%d rows)", len(rows))
+
+    def _run(self):
+        while not self._closed:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("audit flush error")
+
+    def _take(self) -> tuple[list[dict], list[dict]]:
+        with self._cond:
+            retry, self._retry = self._retry, []
+            rows = list(self._buf)
+            self._buf.clear()
+        return retry, rows
+
+    def flush(self):
+        # ล็อกแยก เพื่อไม่ให้สอง thread เขียนซ้อนกัน และไม่บล็อก add() ระหว่างรอ DB
+        with self._flush_lock:
+            retry, rows = self._take()
+            if not retry and not rows:
+                return
+            with self.app.app_context():
+                try:
+                    write_audit_rows(retry + rows)
+                    self.written += len(retry) + len(rows)
+                except Exception:
+                    db.session.rollback()
+                    self.failed += len(retry) + len(rows)
+                    log.exception("audit batch insert failed (%d rows)", len(retry) + len(rows))
+                    self._requeue(retry, rows)
+
+    def _requeue(self, retry: list[dict], rows: list[dict]):
+        # แถวใหม่ได้ลองอีกหนึ่งครั้งในรอบถัดไป แถวที่ล้มซ้ำหรือเกินที่ว่างของบัฟเฟอร์จะถูกทิ้ง
+        with self._cond:
+            room = max(0, self.max_rows - len(self._buf)) if not self._closed else 0
+            self._retry = rows[:room]
+            lost = len(retry) + len(rows) - len(self._retry)
+            self.dropped += lost
+        if lost:
+            log.warning("audit rows dropped after failed insert: %d", lost)
+
+    def pending(self) -> int:
+        return len(self._buf) + len(self._retry)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+
+def write_audit_rows(rows: list[dict]):
+    """INSERT หลายแถว + อัปเดตตารางสรุปรายวัน ใน transaction เดียว (ต้องอยู่ใน app context)"""
+    db.session.execute(insert(AuditLog), rows)
+    bump_search_stats(rows)
+    db.session.commit()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def audit_writer_stats() -> dict | None:
+    return _writer.stats() if _writer is not None else None
+
+
+def close_audit_writer():
+    if _writer is not None:
+        _writer.close()
+
+
+def get_audit_writer() -> AuditWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                cfg = current_app.config
+                _writer = AuditWriter(
+                    current_app._get_current_object(),
+                    flush_rows=cfg.get("AUDIT_FLUSH_ROWS", 100),
+                    flush_ms=cfg.get("AUDIT_FLUSH_MS", 500),
+                    max_rows=cfg.get("AUDIT_BUFFER_MAX", 10000),
+                    overflow=cfg.get("AUDIT_OVERFLOW", "flush"),
+                )
+    return _writer
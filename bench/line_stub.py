@@ -0,0 +1,121 @@
+"""
+LINE Messaging API ปลอมสำหรับทดสอบโหลด (reply / profile / group member) หน่วงเวลาได้
+
+    python bench/line_stub.py --port 9100 --latency-ms 80 --jitter-ms 40
+    LINE_API_BASE_URL=http://127.0.0.1:9100 gunicorn wsgi:app ...
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PROFILE = re.compile(r"^/v2/bot/(profile/(?P<uid>[^/]+)|(group|room)/[^/]+/member/(?P<mid>[^/]+))$")
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: dict[str, int] = {}
+
+    def hit(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+class LineStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency_ms: float = 50, jitter_ms: float = 0, error_rate: float = 0.0):
+        super().__init__(addr, _Handler)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.stats = StubStats()
+
+    def delay(self):
+        d = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if d > 0:
+            time.sleep(d)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive เหมือน api.line.me
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self, kind: str) -> bool:
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.stats.hit(kind + "_error")
+            self._send(500, {"message": "stub error"})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.delay()
+        if self.path == "/v2/bot/message/reply":
+            if not self._maybe_fail("reply"):
+                self.server.stats.hit("reply")
+                self._send(200, {})
+            return
+        self.server.stats.hit("unknown")
+        self._send(404, {"message": "not found"})
+
+    def do_GET(self):
+        self.server.delay()
+        m = _PROFILE.match(self.path)
+        if m:
+            if not self._maybe_fail("profile"):
+                self.server.stats.hit("profile")
+                uid = m.group("uid") or m.group("mid")
+                self._send(200, {"userId": uid, "displayName": f"stub {uid[-5:]}"})
+            return
+        self.server.stats.hit("unknown")
+        self._send(404, {"message": "not found"})
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 50, jitter_ms: float = 0,
+               error_rate: float = 0.0) -> LineStubServer:
+    """เปิด stub ใน thread เบื้องหลัง (port=0 = เลือกพอร์ตว่างให้) ดูพอร์ตจริงที่ server.server_port"""
+    server = LineStubServer((host, port), latency_ms, jitter_ms, error_rate)
+    threading.Thread(target=server.serve_forever, name="line-stub", daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="local LINE Messaging API stub")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="สัดส่วนที่ตอบ 500 (0-1)")
+    args = ap.parse_args()
+    server = LineStubServer((args.host, args.port), args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"LINE stub on http://{args.host}:{server.server_port} (latency {args.latency_ms}±{args.jitter_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+ทดสอบโหลด LINE webhook แบบ end-to-end (payload ลงลายเซ็นจริง -> แอป -> DB -> LINE stub)
+
+    # 1) เตรียมข้อมูล
+    DATABASE_URL=sqlite:///bench.db python bench/seed_data.py --rows 100000 --truncate
+    # 2) รัน (เปิด LINE stub + gunicorn ให้เอง)
+    DATABASE_URL=sqlite:///bench.db python bench/loadtest.py --rows 100000 --concurrency 16 --duration 20
+    # หรือยิงไปที่แอปที่รันอยู่แล้ว (ต้องตั้ง LINE_CHANNEL_SECRET ให้ตรงกับ --secret และชี้ LINE_API_BASE_URL ไป stub)
+    python bench/loadtest.py --url http://127.0.0.1:8000 --secret bench-secret
+
+รายงาน throughput และ p50/p95/p99 ต่อ scenario (และบันทึก JSON ได้ด้วย --json)
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from seed_data import synthetic_plate, bench_user_id, bench_group_id  # noqa: E402
+from line_stub import start_stub  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("userid", "allowed", "denied", "batch")
+EVENT_ID_SLOT = "@@EVENT@@"
+
+
+# ---------- payload ----------
+
+def sign(body: bytes, secret: str) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def text_event(text: str, user_id: str, group_id: str | None = None, event_id: str | None = None) -> dict:
+    source = {"type": "group", "groupId": group_id, "userId": user_id} if group_id else {"type": "user", "userId": user_id}
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "webhookEventId": event_id or uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "source": source,
+        "message": {"type": "text", "id": str(random.randrange(10**17)), "text": text},
+    }
+
+
+class PayloadFactory:
+    def __init__(self, rows: int, users: int, groups: int, found_ratio: float, rnd: random.Random):
+        self.rows, self.users, self.groups = max(1, rows), max(1, users), max(1, groups)
+        self.found_ratio = found_ratio
+        self.rnd = rnd
+
+    def _query(self) -> str:
+        if self.rnd.random() < self.found_ratio:
+            return synthetic_plate(self.rnd.randrange(self.rows))
+        return synthetic_plate(self.rows + self.rnd.randrange(10**6))  # ไม่มีในฐานข้อมูล
+
+    def _allowed_user(self) -> str:
+        return bench_user_id(self.rnd.randrange(self.users))
+
+    def event(self, kind: str, event_id: str | None = None) -> dict:
+        if kind == "userid":
+            return text_event("/userid", self._allowed_user(), event_id=event_id)
+        if kind == "allowed":
+            return text_event(self._query(), self._allowed_user(), event_id=event_id)
+        if kind == "denied":
+            return text_event(self._query(), f"Udenied{self.rnd.randrange(10**6):06d}", event_id=event_id)
+        if kind == "group":
+            return text_event(self._query(), f"Umember{self.rnd.randrange(1000):04d}",
+                              bench_group_id(self.rnd.randrange(self.groups)), event_id=event_id)
+        raise ValueError(kind)
+
+    def body(self, scenario: str, batch_size: int) -> bytes:
+        """payload ต้นแบบ: webhookEventId มี EVENT_ID_SLOT ให้แทนค่าใหม่ทุกครั้งที่ส่ง (ไม่ให้ถูกมองเป็น event ซ้ำ)"""
+        if scenario == "batch":
+            kinds = ["allowed", "allowed", "group", "denied", "userid"]
+            events = [self.event(kinds[i % len(kinds)], f"{EVENT_ID_SLOT}-{i}") for i in range(batch_size)]
+        else:
+            events = [self.event(scenario, f"{EVENT_ID_SLOT}-0")]
+        return json.dumps({"destination": "Ubenchbot", "events": events}, ensure_ascii=False).encode()
+
+
+# ---------- สถิติ ----------
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(name: str, latencies: list[float], errors: int, elapsed: float, events_per_request: int) -> dict:
+    lat = sorted(latencies)
+    n = len(lat) + errors
+    return {
+        "scenario": name,
+        "requests": n,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "events_per_s": round(n * events_per_request / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 1),
+        "p95_ms": round(percentile(lat, 95) * 1000, 1),
+        "p99_ms": round(percentile(lat, 99) * 1000, 1),
+        "max_ms": round(lat[-1] * 1000, 1) if lat else 0.0,
+    }
+
+
+# ---------- ยิงโหลด ----------
+
+def run_scenario(url: str, secret: str, scenario: str, args) -> dict:
+    endpoint = url.rstrip("/") + "/line/webhook"
+    batch = args.batch_size if scenario == "batch" else 1
+    # สร้าง payload ล่วงหน้า ไม่ให้เวลาสร้าง/เซ็นไปปนกับเวลาวัด
+    rnd = random.Random(args.seed)
+    factory = PayloadFactory(args.rows, args.users, args.groups, args.found_ratio, rnd)
+    pool = [factory.body(scenario, batch) for _ in range(args.payloads)]
+    slot = EVENT_ID_SLOT.encode()
+    run_id = uuid.uuid4().hex[:8]
+
+    latencies: list[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    remaining = [args.requests] if args.requests else None
+
+    def worker(tid: int):
+        session = requests.Session()
+        local, local_err = [], 0
+        i = tid
+        while True:
+            if remaining is not None:
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+            elif time.perf_counter() >= deadline:
+                break
+            body = pool[i % len(pool)].replace(slot, f"{run_id}{i:010d}".encode())
+            sig = sign(body, secret)
+            i += args.concurrency
+            t = time.perf_counter()
+            try:
+                r = session.post(endpoint, data=body, timeout=args.timeout,
+                                 headers={"Content-Type": "application/json", "X-Line-Signature": sig})
+                ok = r.status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - t)
+            else:
+                local_err += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_err
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(scenario, latencies, errors[0], time.perf_counter() - start, batch)
+
+
+def spawn_app(args, secret: str, stub_url: str) -> tuple[subprocess.Popen, str]:
+    env = dict(os.environ)
+    env.update({
+        "LINE_CHANNEL_SECRET": secret,
+        "LINE_CHANNEL_ACCESS_TOKEN": env.get("LINE_CHANNEL_ACCESS_TOKEN") or "bench-token",
+        "LINE_API_BASE_URL": stub_url,
+    })
+    if args.async_webhook:
+        env["LINE_ASYNC_WEBHOOK"] = "1"
+    bind = f"127.0.0.1:{args.port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi:app", "-b", bind,
+         "--workers", str(args.workers), "--threads", str(args.threads), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://{bind}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn exited during startup")
+        try:
+            if requests.get(url + "/healthz", timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("app did not become healthy")
+
+
+def print_table(results: list[dict]):
+    cols = ["scenario", "requests", "errors", "throughput_rps", "events_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in cols]
+    print("  ".join(c.rjust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).rjust(w) for c, w in zip(cols, widths)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="end-to-end LINE webhook load test")
+    ap.add_argument("--url", help="แอปที่รันอยู่แล้ว (ไม่ระบุ = เปิด gunicorn + LINE stub ให้เอง)")
+    ap.add_argument("--secret", default=os.getenv("LINE_CHANNEL_SECRET") or "bench-secret")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"คั่นด้วย comma จาก {', '.join(SCENARIOS)}")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=10.0, help="วินาทีต่อ scenario")
+    ap.add_argument("--requests", type=int, default=0, help="จำนวน request ต่อ scenario (แทน --duration)")
+    ap.add_argument("--warmup", type=float, default=2.0, help="วินาทีวอร์มอัปก่อนวัดแต่ละ scenario")
+    ap.add_argument("--batch-size", type=int, default=5, help="จำนวน event ต่อ payload ของ scenario batch")
+    ap.add_argument("--rows", type=int, default=10_000, help="จำนวนรถที่ seed ไว้ (ใช้สร้างคำค้นที่เจอ)")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--groups", type=int, default=10)
+    ap.add_argument("--found-ratio", type=float, default=0.8)
+    ap.add_argument("--payloads", type=int, default=2000, help="จำนวน payload ที่สร้างล่วงหน้าต่อ scenario")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--seed", type=int, default=42)
+    # โหมดเปิดแอปเอง
+    ap.add_argument("--port", type=int, default=8077)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--async-webhook", action="store_true", help="LINE_ASYNC_WEBHOOK=1")
+    ap.add_argument("--stub-latency-ms", type=float, default=50)
+    ap.add_argument("--stub-jitter-ms", type=float, default=20)
+    ap.add_argument("--stub-error-rate", type=float, default=0.0)
+    ap.add_argument("--json", dest="json_out", help="บันทึกผลเป็นไฟล์ JSON")
+    args = ap.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    proc = stub = None
+    url = args.url
+    if not url:
+        stub = start_stub(latency_ms=args.stub_latency_ms, jitter_ms=args.stub_jitter_ms,
+                          error_rate=args.stub_error_rate)
+        proc, url = spawn_app(args, args.secret, f"http://127.0.0.1:{stub.server_port}")
+    db_url = os.getenv("DATABASE_URL", "sqlite:///app.db") if proc else "(external)"
+    print(f"target {url}  db {db_url.split('@')[-1]}  concurrency {args.concurrency}")
+
+    results = []
+    try:
+        for scenario in scenarios:
+            if args.warmup > 0:
+                warm = argparse.Namespace(**{**vars(args), "duration": args.warmup, "requests": 0})
+                run_scenario(url, args.secret, scenario, warm)
+            results.append(run_scenario(url, args.secret, scenario, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    print_table(results)
+    if stub is not None:
+        print(f"LINE stub calls: {stub.stats.snapshot()}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"db": db_url.split("@")[-1], "concurrency": args.concurrency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+micro-benchmark ของฟังก์ชันที่อยู่บนเส้นทางร้อน พร้อม baseline (JSON) ที่เก็บใน repo
+
+    python bench/micro.py                                   # รัน profile quick แล้วแสดงผล
+    python bench/micro.py --save bench/baselines/micro.json # อัปเดต baseline
+    python bench/micro.py --compare bench/baselines/micro.json --threshold 20
+    python bench/micro.py --profile full --only search      # ค้นหาถึง 1M แถว / CSV 1M แถว
+
+โหมด --compare คืน exit code 1 ถ้ามีรายการที่ช้าลงเกิน --threshold เปอร์เซ็นต์
+(baseline ขึ้นกับเครื่อง — ควรเทียบบนเครื่องเดียวกับที่สร้าง baseline)
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+PROFILES = {
+    "quick": {"bubbles": [1, 5, 10], "vehicles": [1_000, 10_000, 100_000], "csv_rows": [10_000, 100_000]},
+    "full": {"bubbles": [1, 5, 10], "vehicles": [1_000, 10_000, 100_000, 1_000_000],
+             "csv_rows": [10_000, 100_000, 1_000_000]},
+}
+GROUPS = ("flex", "signature", "permission", "search", "fuzzy", "csv")
+
+
+# ---------- การจับเวลา ----------
+
+def measure(fn, repeats: int = 7, min_repeat_time: float = 0.05) -> dict:
+    """ปรับจำนวนรอบให้แต่ละ repeat นานอย่างน้อย min_repeat_time แล้วคืนเวลาต่อครั้ง (median / min)"""
+    fn()  # วอร์มอัป (import, แคช, statement cache ของ SQLAlchemy)
+    number = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t
+        if elapsed >= min_repeat_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_repeat_time / 10 else 2
+    samples = [elapsed / number]
+    for _ in range(repeats - 1):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t) / number)
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "number": number,
+        "repeats": repeats,
+    }
+
+
+# ---------- ชุด benchmark ----------
+
+def _fake_vehicle(i: int):
+    from seed_data import synthetic_row
+    row = synthetic_row(i, date.today(), datetime(2025, 1, 1))
+    return SimpleNamespace(id=i + 1, **row)
+
+
+def bench_flex(prof, run):
+    from flex_templates import to_flex_message, to_flex_json
+    for n in prof["bubbles"]:
+        vehicles = [_fake_vehicle(i) for i in range(n)]
+        run(f"flex.to_flex_message[{n}]", lambda v=vehicles: json.dumps(to_flex_message(v), ensure_ascii=False))
+        to_flex_json(vehicles)  # เติมแคช bubble ก่อนวัดเส้นทางปกติ
+        run(f"flex.to_flex_json_cached[{n}]", lambda v=vehicles: to_flex_json(v))
+
+
+def bench_signature(prof, run):
+    from linebot_app import _verify_signature
+    from loadtest import PayloadFactory, sign
+    import random
+    factory = PayloadFactory(1000, 100, 10, 0.8, random.Random(1))
+    for name, body in (("1_event", factory.body("allowed", 1)), ("5_events", factory.body("batch", 5))):
+        sig = sign(body, "bench-secret")
+        run(f"signature.verify[{name}]", lambda b=body, s=sig: _verify_signature(b, s, "bench-secret"))
+
+
+def bench_permission(prof, run):
+    from models import db, LineUser
+    from utils import has_line_permission, _get_acl_cache
+    from seed_data import bench_user_id
+    if not LineUser.query.filter_by(line_user_id=bench_user_id(0)).first():
+        db.session.add_all(LineUser(line_user_id=bench_user_id(n), is_active=True) for n in range(1000))
+        db.session.commit()
+    uid = bench_user_id(7)
+    has_line_permission(uid, None)
+    run("permission.has_line_permission[cached]", lambda: has_line_permission(uid, None))
+
+    def cold():
+        _get_acl_cache().clear()
+        has_line_permission(uid, None)
+    run("permission.has_line_permission[db]", cold)
+
+
+def bench_search(prof, run):
+    from models import db, Vehicle
+    from plate_search import search_vehicles
+    from plate_fuzzy import build_plate_index
+    from seed_data import insert_vehicles, synthetic_plate
+    have = db.session.query(Vehicle).count()
+    cutoff = date.today() - timedelta(days=35)
+    for n in prof["vehicles"]:
+        if have < n:
+            print(f"  seeding vehicles {have:,} -> {n:,} ...", file=sys.stderr)
+            insert_vehicles(have, n)
+            have = n
+            build_plate_index()  # search.miss รวมการค้นทะเบียนใกล้เคียงด้วย
+        hit = synthetic_plate(n // 2)
+        run(f"search.exact[{n}]", lambda t=hit: search_vehicles(t, limit=10, min_recorded_date=cutoff))
+        run(f"search.prefix[{n}]", lambda t=hit[:-2]: search_vehicles(t, limit=10, min_recorded_date=cutoff))
+        run(f"search.miss[{n}]", lambda t=synthetic_plate(n + 12345): search_vehicles(t, limit=10, min_recorded_date=cutoff))
+        db.session.remove()
+
+
+def bench_fuzzy(prof, run):
+    import random
+    from plate_fuzzy import PlateIndex
+    from plate_search import normalize_plate
+    from seed_data import synthetic_plate
+    rnd = random.Random(1)
+    for n in prof["vehicles"]:
+        index = PlateIndex.from_keys(normalize_plate(synthetic_plate(i)) for i in range(n))
+        # พิมพ์ผิด 1 ตัว (แทนตัวเลขท้าย) ของทะเบียนที่มีอยู่จริง
+        queries = []
+        for _ in range(200):
+            key = normalize_plate(synthetic_plate(rnd.randrange(n)))
+            queries.append(key[:-1] + str((int(key[-1]) + 1) % 10))
+        it = itertools.cycle(queries)
+        run(f"fuzzy.lookup[{n}]", lambda: index.lookup(next(it)))
+
+
+def _csv_bytes(rows: int) -> bytes:
+    import csv
+    from seed_data import synthetic_row
+    buf = io.StringIO()
+    cols = ["license_plate", "brand", "model", "owner_name", "contact_info", "color", "vin", "recorded_date"]
+    w = csv.writer(buf)
+    w.writerow(cols)
+    today, now = date.today(), datetime.utcnow()
+    for i in range(rows):
+        r = synthetic_row(i, today, now)
+        w.writerow([r[c].isoformat() if c == "recorded_date" else r[c] for c in cols])
+    return buf.getvalue().encode("utf-8")
+
+
+def bench_csv(prof, run):
+    from vehicle_import import open_csv, parse_vehicle_row
+    for n in prof["csv_rows"]:
+        data = _csv_bytes(n)
+
+        def parse(d=data):
+            reader, cols = open_csv(io.BytesIO(d))
+            for row in reader:
+                parse_vehicle_row(row, cols)
+        run(f"csv.parse[{n}]", parse, repeats=3, min_repeat_time=0)
+
+
+BENCHES = {"flex": bench_flex, "signature": bench_signature, "permission": bench_permission,
+           "search": bench_search, "fuzzy": bench_fuzzy, "csv": bench_csv}
+
+
+# ---------- เปรียบเทียบกับ baseline ----------
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """เทียบด้วยค่า min ของแต่ละ repeat (ถูกรบกวนจากโหลดอื่นบนเครื่องน้อยกว่า median)"""
+    regressions = []
+    base = baseline.get("results", {})
+    print(f"\n{'benchmark':44} {'baseline µs':>14} {'current µs':>14} {'change':>9}")
+    for name, res in current["results"].items():
+        if name not in base:
+            print(f"{name:44} {'-':>14} {res['min_us']:>14.3f} {'new':>9}")
+            continue
+        old, new = base[name]["min_us"], res["min_us"]
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:44} {old:>14.3f} {new:>14.3f} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="micro-benchmarks with stored baselines")
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    ap.add_argument("--only", default="", help=f"คั่นด้วย comma จาก {', '.join(GROUPS)}")
+    ap.add_argument("--database-url", default=None,
+                    help="ฐานข้อมูลสำหรับทดสอบเท่านั้น (จะถูกเพิ่มรถสังเคราะห์) ค่าเริ่มต้น = SQLite ชั่วคราว")
+    ap.add_argument("--save", help="บันทึกผลเป็น baseline JSON")
+    ap.add_argument("--compare", help="ไฟล์ baseline ที่จะเทียบ")
+    ap.add_argument("--threshold", type=float, default=20.0, help="เปอร์เซ็นต์ที่ถือว่าช้าลง (regression)")
+    args = ap.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()] or list(GROUPS)
+    tmpdir = tempfile.mkdtemp(prefix="spf_micro_")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'micro.db')}"
+    os.environ.setdefault("METRICS_DIR", os.path.join(tmpdir, "metrics"))
+    os.environ.setdefault("LINE_CHANNEL_SECRET", "bench-secret")
+    os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench-token")
+
+    from app import create_app
+    from models import db
+    app = create_app()
+
+    results = {}
+
+    def run(name, fn, repeats=7, min_repeat_time=0.05):
+        res = measure(fn, repeats, min_repeat_time)
+        results[name] = res
+        print(f"{name:44} {res['median_us']:>14.3f} µs  (min {res['min_us']:.3f}, x{res['number']})")
+
+    prof = PROFILES[args.profile]
+    try:
+        with app.test_request_context():
+            for g in groups:
+                BENCHES[g](prof, run)
+            dialect = db.engine.dialect.name
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    current = {
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "profile": args.profile,
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "database": dialect,
+        },
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write("\n")
+        print(f"saved baseline -> {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nno regressions over {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+สร้างข้อมูลรถสังเคราะห์ (ทะเบียนไทย) สำหรับทดสอบโหลด 10k - 5M แถว
+
+    DATABASE_URL=sqlite:///bench.db python bench/seed_data.py --rows 100000 --truncate
+    DATABASE_URL=postgresql+psycopg2://... python bench/seed_data.py --rows 1000000
+
+ทะเบียนของแถวที่ i ได้จาก synthetic_plate(i) เสมอ (ไม่สุ่ม) loadtest.py จึงสร้างคำค้นที่เจอจริงได้
+โดยไม่ต้องอ่านฐานข้อมูล
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONSONANTS = "กขคฆงจฉชซฌญฎฐฒณดตถทธนบปผพฟภมยรลวศษสหฬอฮ"
+BRANDS = [("Toyota", ["Hilux Revo", "Fortuner", "Camry", "Yaris"]), ("Isuzu", ["D-Max", "MU-X"]),
+          ("Honda", ["Civic", "City", "CR-V"]), ("Mitsubishi", ["Triton", "Pajero Sport"]),
+          ("Nissan", ["Navara", "Almera"]), ("Ford", ["Ranger", "Everest"]), ("Mazda", ["BT-50", "CX-5"])]
+COLORS = ["ขาว", "ดำ", "เทา", "บรอนซ์เงิน", "แดง", "น้ำเงิน"]
+FIRST_NAMES = ["สมชาย", "สมหญิง", "วิชัย", "พรทิพย์", "อนุชา", "กมลวรรณ", "ธนพล", "สุดารัตน์"]
+LAST_NAMES = ["ใจดี", "รุ่งเรือง", "ศรีสุข", "วงศ์ไทย", "แก้วมณี", "บุญมา"]
+
+# เลขนำหน้า (0 = ไม่มี) x พยัญชนะ 2 ตัว x เลข 1-9999
+_N_CONS = len(CONSONANTS)
+PLATE_SPACE = 10 * _N_CONS * _N_CONS * 9999
+_STRIDE = 1_000_003  # จำนวนเฉพาะ ไม่หาร PLATE_SPACE -> i ต่างกันได้ทะเบียนต่างกัน และกระจายทั่ว
+
+
+def synthetic_plate(i: int) -> str:
+    j = (i * _STRIDE) % PLATE_SPACE
+    number = j % 9999 + 1
+    j //= 9999
+    c2 = CONSONANTS[j % _N_CONS]
+    j //= _N_CONS
+    c1 = CONSONANTS[j % _N_CONS]
+    prefix = j // _N_CONS
+    return f"{prefix or ''}{c1}{c2}{number}"
+
+
+def synthetic_row(i: int, today: date, now: datetime) -> dict:
+    from plate_search import normalize_plate
+    plate = synthetic_plate(i)
+    brand, models = BRANDS[i % len(BRANDS)]
+    return {
+        "license_plate": plate,
+        "plate_key": normalize_plate(plate),
+        "brand": brand,
+        "model": models[(i // 7) % len(models)],
+        "owner_name": f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // 3) % len(LAST_NAMES)]}",
+        "contact_info": f"08{i % 100_000_000:08d}",
+        "color": COLORS[(i // 5) % len(COLORS)],
+        "vin": f"MR0{i:014d}",
+        # ~60% อยู่ในช่วง LINE_MAX_AGE_DAYS (35) ที่เหลือเก่ากว่า
+        "recorded_date": today - timedelta(days=(i * 7) % 60),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def bench_user_id(n: int) -> str:
+    return f"Ubench{n:05d}"
+
+
+def bench_group_id(n: int) -> str:
+    return f"Cbench{n:05d}"
+
+
+def insert_vehicles(lo: int, hi: int, chunk: int = 10_000, progress: bool = False):
+    """INSERT แถว synthetic_row(lo..hi-1) ทีละ chunk (ต้องอยู่ใน app context)"""
+    from sqlalchemy import insert
+    from models import db, Vehicle
+
+    t0 = time.perf_counter()
+    today, now = date.today(), datetime.utcnow()
+    for start in range(lo, hi, chunk):
+        stop = min(start + chunk, hi)
+        db.session.execute(insert(Vehicle), [synthetic_row(i, today, now) for i in range(start, stop)])
+        db.session.commit()
+        if progress:
+            done = stop - lo
+            rate = done / (time.perf_counter() - t0)
+            print(f"\rvehicles {done:,}/{hi - lo:,} ({rate:,.0f} rows/s)", end="", flush=True)
+    if progress:
+        print()
+
+
+def seed(rows: int, users: int = 100, groups: int = 10, chunk: int = 10_000, truncate: bool = False,
+         start: int = 0):
+    from sqlalchemy import delete
+    from app import create_app
+    from models import db, Vehicle, LineUser, LineGroup
+
+    app = create_app()
+    with app.app_context():
+        if truncate:
+            db.session.execute(delete(Vehicle))
+            db.session.execute(delete(LineUser).where(LineUser.line_user_id.like("Ubench%")))
+            db.session.execute(delete(LineGroup).where(LineGroup.line_group_id.like("Cbench%")))
+            db.session.commit()
+
+        t0 = time.perf_counter()
+        insert_vehicles(start, start + rows, chunk, progress=True)
+
+        existing = {u for (u,) in db.session.query(LineUser.line_user_id).filter(LineUser.line_user_id.like("Ubench%"))}
+        db.session.add_all(LineUser(line_user_id=bench_user_id(n), is_active=True, display_name=f"bench {n}")
+                           for n in range(users) if bench_user_id(n) not in existing)
+        existing = {g for (g,) in db.session.query(LineGroup.line_group_id).filter(LineGroup.line_group_id.like("Cbench%"))}
+        db.session.add_all(LineGroup(line_group_id=bench_group_id(n), is_active=True, display_name=f"กลุ่ม bench {n}")
+                           for n in range(groups) if bench_group_id(n) not in existing)
+        db.session.commit()
+        print(f"seeded {rows:,} vehicles, {users} LINE users, {groups} groups in {time.perf_counter() - t0:.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="seed synthetic Thai-plate vehicles for load tests")
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--start", type=int, default=0, help="index แรก (ใช้เติมข้อมูลต่อจากรอบก่อน)")
+    ap.add_argument("--users", type=int, default=100, help="จำนวน LINE user ที่มีสิทธิ์ (Ubench00000...)")
+    ap.add_argument("--groups", type=int, default=10)
+    ap.add_argument("--chunk", type=int, default=10_000)
+    ap.add_argument("--truncate", action="store_true", help="ลบ vehicles ทั้งหมดและผู้ใช้ bench เดิมก่อน")
+    args = ap.parse_args()
+    seed(args.rows, args.users, args.groups, args.chunk, args.truncate, args.start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# รายการแคชทั้งหมดในโปรเซส (ชื่อ -> แคช) สำหรับแสดงสถิติ
+_registry: dict[str, "TTLCache"] = {}
+
+
+class _Flight:
+    __slots__ = ("event", "value")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class TTLCache:
+    """
+    แคชในโปรเซสแบบ LRU + TTL (thread-safe)
+    - ค่า None ถือเป็นผลลบ (เช่นเรียก API ไม่สำเร็จ) และเก็บไว้ตาม negative_ttl
+    - get_or_load(): ถ้าหลาย thread miss คีย์เดียวกันพร้อมกัน จะโหลดจริงแค่ครั้งเดียว (single-flight)
+      loader ที่ throw ไม่ถูกแคช (คืน None ให้รอบนั้น แล้วโหลดใหม่ครั้งถัดไป)
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0, negative_ttl: float | None = None):
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def _get_locked(self, key, now: float):
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        value, expires = item
+        if expires <= now:
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get_locked(key, time.monotonic())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            if value is None:
+                self.negative_hits += 1
+            return value
+
+    def set(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            value = self._get_locked(key, time.monotonic())
+            if value is not _MISSING:
+                self.hits += 1
+                if value is None:
+                    self.negative_hits += 1
+                return value
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            return flight.value
+
+        try:
+            self.loads += 1
+            try:
+                flight.value = loader()
+            except Exception as e:
+                # ความผิดพลาดชั่วคราว (เช่น DB หลุด) ไม่ใช่ผลลบ -> ไม่เก็บลงแคช
+                self.load_errors += 1
+                log.warning("cache %s: load failed for %r: %s", self.name, key, e)
+                flight.value = None
+                return None
+            self.set(key, flight.value)
+            return flight.value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+def cache_stats() -> dict:
+    return {name: c.stats() for name, c in _registry.items()}
+
+
+class VersionStamp:
+    """
+    ตัวบอกเวอร์ชันที่แชร์ข้ามโปรเซส (gunicorn workers บนเครื่องเดียวกัน) ผ่าน mtime ของไฟล์
+    - bump(): แจ้งว่าข้อมูลเปลี่ยน
+    - changed(): True ถ้ามีโปรเซสใด bump หลังจากที่เราเห็นครั้งล่าสุด (ใช้ os.stat อย่างเดียว)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._seen = self._read()
+
+    def _read(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def bump(self):
+        try:
+            with open(self.path, "w") as f:
+                f.write(str(time.time_ns()))
+            now = time.time_ns()
+            os.utime(self.path, ns=(now, now))
+        except OSError:
+            pass
+
+    def changed(self) -> bool:
+        cur = self._read()
+        if cur != self._seen:
+            self._seen = cur
+            return True
+        return False
+
+
+class SnapshotStore:
+    """
+    ที่เก็บ snapshot (JSON) แบบมีอายุ ในไฟล์ SQLite บนเครื่อง — ทุก gunicorn worker ใช้ไฟล์เดียวกัน
+    จึงเห็น snapshot ชุดเดียวกัน และการล้าง (delete) มีผลกับทุก worker ทันที
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+                    )
+                    self._ready = True
+        return conn
+
+    def get(self, key: str):
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT value, expires FROM snapshots WHERE key = ?", (key,)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time() + ttl),
+                )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key: str):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM snapshots WHERE key = ?", (key,))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def get_or_build(self, key: str, ttl: float, builder):
+        value = self.get(key)
+        if value is None:
+            value = builder()
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -5,9 +5,98 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # connection pool (ว่าง = ค่าเริ่มต้นตาม dialect ดู dbpool.py) -> SQLALCHEMY_ENGINE_OPTIONS
+    DB_POOL_SIZE = os.getenv("DB_POOL_SIZE", "")
+    DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW", "")
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "")
+    DB_POOL_RECYCLE = os.getenv("DB_POOL_RECYCLE", "")
+    DB_POOL_TIMEOUT = os.getenv("DB_POOL_TIMEOUT", "")
+    SQLITE_WAL = os.getenv("SQLITE_WAL", "1").lower() in ("1", "true", "yes")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # /metrics (Prometheus): รวมค่าของทุก gunicorn worker ผ่านไฟล์ในโฟลเดอร์ METRICS_DIR
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+    METRICS_DIR = os.getenv("METRICS_DIR", "")          # ว่าง = โฟลเดอร์ temp ของระบบ
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")      # ถ้าตั้ง ต้องส่ง Authorization: Bearer <token>
+
+    # นับ query/เวลา DB ต่อ request + header Server-Timing + log query ช้า (ค่าเริ่มต้น: ปิด)
+    SQL_TRACE_ENABLED = os.getenv("SQL_TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+    SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+    SQL_QUERY_COUNT_WARN = int(os.getenv("SQL_QUERY_COUNT_WARN", "20"))  # เตือนเมื่อ request ใช้ query เกินนี้ (0 = ไม่เตือน)
+
+    # migrate schema อัตโนมัติตอนบูตถ้าเวอร์ชันในฐานข้อมูลเก่ากว่าโค้ด (0 = ให้รัน `flask --app app migrate` เอง)
+    SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+
     # LINE creds
     LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET", "")
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "")
 
     # ปรับจำนวนวันหมดอายุผลค้นหาได้ผ่าน ENV (ค่าเริ่มต้น 35)
     LINE_MAX_AGE_DAYS = int(os.getenv("LINE_MAX_AGE_DAYS", "35"))
+
+    # ตอบ webhook ทันทีแล้วประมวลผล events ใน thread pool เบื้องหลัง (ค่าเริ่มต้น: ปิด)
+    LINE_ASYNC_WEBHOOK = os.getenv("LINE_ASYNC_WEBHOOK", "0").lower() in ("1", "true", "yes")
+    LINE_WORKER_THREADS = int(os.getenv("LINE_WORKER_THREADS", "4"))
+    LINE_QUEUE_MAXSIZE = int(os.getenv("LINE_QUEUE_MAXSIZE", "200"))
+    LINE_DRAIN_TIMEOUT = float(os.getenv("LINE_DRAIN_TIMEOUT", "10"))
+
+    # payload ที่มีหลาย event: resolve สิทธิ์/ค้นหาเป็นชุด และเรียก LINE API พร้อมกัน (thread ต่อ worker)
+    LINE_BATCH_ENABLED = os.getenv("LINE_BATCH_ENABLED", "1").lower() in ("1", "true", "yes")
+    LINE_BATCH_THREADS = int(os.getenv("LINE_BATCH_THREADS", "8"))
+
+    # ค้นทะเบียนแบบทนพิมพ์ผิด เมื่อค้นปกติไม่พบ (ดัชนีในหน่วยความจำต่อ worker, ดู plate_fuzzy.py)
+    PLATE_FUZZY_ENABLED = os.getenv("PLATE_FUZZY_ENABLED", "1").lower() in ("1", "true", "yes")
+    PLATE_FUZZY_MIN_LEN = int(os.getenv("PLATE_FUZZY_MIN_LEN", "4"))
+    PLATE_FUZZY_MAX_KEYS = int(os.getenv("PLATE_FUZZY_MAX_KEYS", "20"))
+    PLATE_FUZZY_JOURNAL = os.getenv("PLATE_FUZZY_JOURNAL", "")
+
+    # กัน event ซ้ำจาก LINE (redelivery) ด้วย webhookEventId — store: "memory" (ต่อ worker) | "file" (แชร์ทุก worker บนเครื่อง)
+    LINE_DEDUPE_ENABLED = os.getenv("LINE_DEDUPE_ENABLED", "1").lower() in ("1", "true", "yes")
+    LINE_DEDUPE_TTL = float(os.getenv("LINE_DEDUPE_TTL", "3600"))
+    LINE_DEDUPE_SIZE = int(os.getenv("LINE_DEDUPE_SIZE", "50000"))
+    LINE_DEDUPE_STORE = os.getenv("LINE_DEDUPE_STORE", "memory")
+    LINE_DEDUPE_PATH = os.getenv("LINE_DEDUPE_PATH", "")
+
+    # บัฟเฟอร์ audit log แล้วเขียนเป็นชุด (flush ทุก N แถว หรือทุก T มิลลิวินาที)
+    AUDIT_BUFFER_ENABLED = os.getenv("AUDIT_BUFFER_ENABLED", "1").lower() in ("1", "true", "yes")
+    AUDIT_FLUSH_ROWS = int(os.getenv("AUDIT_FLUSH_ROWS", "100"))
+    AUDIT_FLUSH_MS = int(os.getenv("AUDIT_FLUSH_MS", "500"))
+    AUDIT_BUFFER_MAX = int(os.getenv("AUDIT_BUFFER_MAX", "10000"))
+    AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "flush")  # "flush" | "drop"
+
+    # แคชชื่อสมาชิก LINE (วินาที / จำนวนรายการ) — ผลลบ (เรียกไม่สำเร็จ) ใช้ NEG_TTL
+    LINE_PROFILE_CACHE_TTL = float(os.getenv("LINE_PROFILE_CACHE_TTL", "600"))
+    LINE_PROFILE_CACHE_NEG_TTL = float(os.getenv("LINE_PROFILE_CACHE_NEG_TTL", "60"))
+    LINE_PROFILE_CACHE_SIZE = int(os.getenv("LINE_PROFILE_CACHE_SIZE", "5000"))
+
+    # แคชสิทธิ์ LINE user/group (ล้างทันทีเมื่อแก้ไขผ่านหน้าแอดมิน ทุก worker ผ่านไฟล์ stamp)
+    LINE_ACL_CACHE_TTL = float(os.getenv("LINE_ACL_CACHE_TTL", "300"))
+    LINE_ACL_CACHE_NEG_TTL = float(os.getenv("LINE_ACL_CACHE_NEG_TTL", "5"))
+    LINE_ACL_CACHE_SIZE = int(os.getenv("LINE_ACL_CACHE_SIZE", "10000"))
+    LINE_ACL_STAMP_FILE = os.getenv("LINE_ACL_STAMP_FILE", "")
+
+    # LINE Messaging API client (keep-alive pool, timeout, retry, circuit breaker)
+    LINE_API_BASE_URL = os.getenv("LINE_API_BASE_URL", "https://api.line.me")
+    LINE_CONNECT_TIMEOUT = float(os.getenv("LINE_CONNECT_TIMEOUT", "3"))
+    LINE_READ_TIMEOUT = float(os.getenv("LINE_READ_TIMEOUT", "10"))
+    LINE_MAX_RETRIES = int(os.getenv("LINE_MAX_RETRIES", "2"))
+    LINE_RETRY_BACKOFF = float(os.getenv("LINE_RETRY_BACKOFF", "0.5"))
+    LINE_MAX_RETRY_WAIT = float(os.getenv("LINE_MAX_RETRY_WAIT", "5"))
+    LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", "10"))
+    LINE_BREAKER_THRESHOLD = int(os.getenv("LINE_BREAKER_THRESHOLD", "5"))
+    LINE_BREAKER_COOLDOWN = float(os.getenv("LINE_BREAKER_COOLDOWN", "30"))
+
+    # อัปโหลด CSV: จำนวนแถวต่อ INSERT/commit
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "1000"))
+
+    # แคช snapshot แดชบอร์ด (วินาที; 0 = ปิด) ในไฟล์ SQLite ที่ทุก worker ใช้ร่วมกัน
+    DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+    DASHBOARD_CACHE_PATH = os.getenv("DASHBOARD_CACHE_PATH", "")
+
+    # จำนวนแถวต่อหน้าในหน้ารายการรถ (แบ่งหน้าแบบ keyset ตาม id)
+    ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+
+    # เก็บ audit_logs กี่วันก่อนย้ายไปไฟล์ archive (0 = เก็บตลอด) — ใช้กับคำสั่ง archive-audit-logs
+    AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+    AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "archive")
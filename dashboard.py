@@ -1,38 +1,82 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from datetime import datetime, date, timedelta, time
-from collections import Counter
-from sqlalchemy import func
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, select, extract, tuple_
 from zoneinfo import ZoneInfo
+import os
+import tempfile
 
 from models import Vehicle, LineUser, LineGroup, Admin, AuditLog, db
-from utils import login_required, hash_password
+from utils import login_required, hash_password, invalidate_line_user, invalidate_line_group
+from plate_search import plate_search_condition, fuzzy_plate_filter, rank_fuzzy, normalize_plate
+from plate_fuzzy import plate_keys_changed, plate_index_reload, plate_fuzzy_stats
+from vehicle_import import import_vehicles_csv, CSVHeaderError, MODES as IMPORT_MODES
+from cache import cache_stats, SnapshotStore
+from search_stats import daily_search_counts
+from dbutil import BKK_UTC_OFFSET_HOURS, escape_like
+from line_client import line_client_stats
+from dbpool import pool_stats
+from linebot_app import line_dedupe_stats
+from audit_writer import audit_writer_stats
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/admin")
 
 
-@dashboard_bp.route("/")
-@login_required
-def index():
-    # --------- การ์ดสรุป ---------
+_snapshots = None
+
+def _get_snapshot_store() -> SnapshotStore:
+    global _snapshots
+    if _snapshots is None:
+        path = current_app.config.get("DASHBOARD_CACHE_PATH") or os.path.join(
+            tempfile.gettempdir(), "spf_dashboard_cache.sqlite3"
+        )
+        _snapshots = SnapshotStore(path)
+    return _snapshots
+
+
+@dashboard_bp.after_request
+def _invalidate_dashboard_snapshot(response):
+    # ทุก POST ที่สำเร็จในหน้าแอดมิน (เพิ่ม/แก้/ลบ รถ ผู้ใช้ กลุ่ม แอดมิน) ล้าง snapshot ของแดชบอร์ด
+    if request.method == "POST" and response.status_code < 400:
+        _get_snapshot_store().delete("dashboard")
+    return response
+
+
+def _build_dashboard_snapshot() -> dict:
+    """ตัวเลขสรุปและข้อมูลกราฟของแดชบอร์ด (JSON ได้ทั้งหมด เพื่อแคชข้าม worker)"""
+    # --------- การ์ดสรุป + สถานะสิทธิ์ LINE (query เดียว) ---------
+    def count_of(model, *conds):
+        return select(func.count(model.id)).where(*conds).scalar_subquery()
+
+    row = db.session.execute(select(
+        count_of(Vehicle).label("vehicles"),
+        count_of(LineUser).label("line_users"),
+        count_of(LineUser, LineUser.is_active.is_(True)).label("users_active"),
+        count_of(LineUser, LineUser.is_active.is_(False)).label("users_inactive"),
+        count_of(LineGroup).label("line_groups"),
+        count_of(LineGroup, LineGroup.is_active.is_(True)).label("groups_active"),
+        count_of(LineGroup, LineGroup.is_active.is_(False)).label("groups_inactive"),
+        count_of(Admin).label("admins"),
+    )).one()
     counts = {
-        "vehicles": Vehicle.query.count(),
-        "line_users": LineUser.query.count(),
-        "line_groups": LineGroup.query.count(),
-        "admins": Admin.query.count(),
+        "vehicles": row.vehicles,
+        "line_users": row.line_users,
+        "line_groups": row.line_groups,
+        "admins": row.admins,
     }
 
     # --------- กราฟ 1: จำนวนรถตามยี่ห้อ (Top 8) ---------
+    brand_count = func.count(Vehicle.id)
     brand_rows = (
-        db.session.query(Vehicle.brand, func.count(Vehicle.id))
+        db.session.query(Vehicle.brand, brand_count)
         .group_by(Vehicle.brand)
+        .order_by(brand_count.desc())
+        .limit(8)
         .all()
     )
-    brand_pairs = [((b or "ไม่ระบุ"), c) for b, c in brand_rows]
-    brand_pairs.sort(key=lambda x: x[1], reverse=True)
-    brand_labels = [p[0] for p in brand_pairs[:8]]
-    brand_values = [p[1] for p in brand_pairs[:8]]
+    brand_labels = [(b or "ไม่ระบุ") for b, _ in brand_rows]
+    brand_values = [c for _, c in brand_rows]
 
-    # --------- กราฟ 2: จำนวนรถที่บันทึกต่อเดือน (12 เดือนล่าสุด) ---------
+    # --------- กราฟ 2: จำนวนรถที่บันทึกต่อเดือน (12 เดือนล่าสุด, GROUP BY ใน DB) ---------
     def step_months(d: date, delta: int) -> date:
         y = d.year + (d.month - 1 + delta) // 12
         m = (d.month - 1 + delta) % 12 + 1
@@ -41,15 +85,17 @@ def index():
     today = date.today()
     start_month = step_months(date(today.year, today.month, 1), -11)
 
-    per_month = Counter()
-    month_rows = (
-        db.session.query(Vehicle.recorded_date)
-        .filter(Vehicle.recorded_date >= start_month)
-        .all()
-    )
-    for (rd,) in month_rows:
-        if rd:
-            per_month[(rd.year, rd.month)] += 1
+    year_col = extract("year", Vehicle.recorded_date)
+    month_col = extract("month", Vehicle.recorded_date)
+    per_month = {
+        (int(y), int(m)): c
+        for y, m, c in (
+            db.session.query(year_col, month_col, func.count(Vehicle.id))
+            .filter(Vehicle.recorded_date >= start_month)
+            .group_by(year_col, month_col)
+            .all()
+        )
+    }
 
     month_labels, month_values = [], []
     for i in range(12):
@@ -58,30 +104,16 @@ def index():
         month_values.append(per_month.get((d.year, d.month), 0))
 
     # --------- กราฟ 3–4: สถานะสิทธิ์ LINE ---------
-    users_active = db.session.query(func.count(LineUser.id)).filter(LineUser.is_active.is_(True)).scalar() or 0
-    users_inactive = db.session.query(func.count(LineUser.id)).filter(LineUser.is_active.is_(False)).scalar() or 0
-    groups_active = db.session.query(func.count(LineGroup.id)).filter(LineGroup.is_active.is_(True)).scalar() or 0
-    groups_inactive = db.session.query(func.count(LineGroup.id)).filter(LineGroup.is_active.is_(False)).scalar() or 0
+    users_active, users_inactive = row.users_active, row.users_inactive
+    groups_active, groups_inactive = row.groups_active, row.groups_inactive
 
     # --------- กราฟ 5: จำนวนการค้นหาต่อวัน (อิงเวลาไทย) ---------
     tz_bkk = ZoneInfo("Asia/Bangkok")
     today_bkk = datetime.now(tz_bkk).date()
     start_day_bkk = today_bkk - timedelta(days=13)
 
-    # เที่ยงคืนของวันเริ่มต้น (เวลาไทย) -> แปลงเป็น UTC เพื่อ filter DB (เก็บเป็น UTC)
-    start_bkk_dt = datetime.combine(start_day_bkk, time.min, tzinfo=tz_bkk)
-    start_utc_dt = start_bkk_dt.astimezone(ZoneInfo("UTC"))
-
-    per_day = Counter()
-    for (w,) in (
-        db.session.query(AuditLog.when)
-        .filter(AuditLog.when >= start_utc_dt)
-        .all()
-    ):
-        if not w:
-            continue
-        local_day = w.astimezone(tz_bkk).date()
-        per_day[local_day] += 1
+    # อ่านจากตารางสรุปรายวัน (search_daily_stats) แทนการสแกน audit_logs
+    per_day = daily_search_counts(start_day_bkk, today_bkk)
 
     day_labels, day_values = [], []
     for i in range(14):
@@ -89,36 +121,143 @@ def index():
         day_labels.append(f"{d.day:02d}/{d.month:02d}")  # dd/mm (ไทย)
         day_values.append(per_day.get(d, 0))
 
-    # ตาราง Log ล่าสุด & รายการรถล่าสุด
-    recent_logs = AuditLog.query.order_by(AuditLog.id.desc()).limit(20).all()
-    recent = Vehicle.query.order_by(Vehicle.id.desc()).limit(5).all()
-
-    return render_template(
-        "dashboard.html",
+    return dict(
         counts=counts,
         brand_labels=brand_labels, brand_values=brand_values,
         month_labels=month_labels, month_values=month_values,
         users_active=users_active, users_inactive=users_inactive,
         groups_active=groups_active, groups_inactive=groups_inactive,
         day_labels=day_labels, day_values=day_values,
-        recent_logs=recent_logs, tz_bkk=tz_bkk,
+    )
+
+
+@dashboard_bp.route("/")
+@login_required
+def index():
+    ttl = current_app.config.get("DASHBOARD_CACHE_TTL", 60)
+    if ttl > 0:
+        snapshot = _get_snapshot_store().get_or_build("dashboard", ttl, _build_dashboard_snapshot)
+    else:
+        snapshot = _build_dashboard_snapshot()
+
+    # ตาราง Log ล่าสุด & รายการรถล่าสุด (query เล็กผ่าน index จึงไม่แคช)
+    recent_logs = AuditLog.query.order_by(AuditLog.id.desc()).limit(20).all()
+    recent = Vehicle.query.order_by(Vehicle.id.desc()).limit(5).all()
+
+    return render_template(
+        "dashboard.html",
+        recent_logs=recent_logs, tz_bkk=ZoneInfo("Asia/Bangkok"),
         recent=recent,
+        **snapshot,
     )
 
 
+@dashboard_bp.route("/stats")
+@login_required
+def stats():
+    # สถิติภายในโปรเซส (แคช ฯลฯ) ของ worker ที่รับ request นี้
+    return jsonify({
+        "caches": cache_stats(),
+        "line_api": line_client_stats(),
+        "dashboard_snapshot": _get_snapshot_store().stats(),
+        "db_pool": pool_stats(db.engine),
+        "line_dedupe": line_dedupe_stats(),
+        "plate_fuzzy": plate_fuzzy_stats(),
+        "audit_writer": audit_writer_stats(),
+    })
+
+
+# -----------------------------
+# Audit logs
+# -----------------------------
+def _bkk_midnight_utc(d: date) -> datetime:
+    # เที่ยงคืนเวลาไทยของวันนั้น -> UTC (naive) ตามที่เก็บใน audit_logs.when
+    return datetime.combine(d, datetime.min.time()) - timedelta(hours=BKK_UTC_OFFSET_HOURS)
+
+
+def _parse_date(text: str) -> date | None:
+    try:
+        return date.fromisoformat(text) if text else None
+    except ValueError:
+        return None
+
+
+@dashboard_bp.route("/logs")
+@login_required
+def audit_logs_list():
+    f = {k: (request.args.get(k) or "").strip() for k in ("date_from", "date_to", "user_id", "group_id", "allowed", "q")}
+    page_size = current_app.config.get("ADMIN_PAGE_SIZE", 50)
+
+    query = AuditLog.query
+    d_from, d_to = _parse_date(f["date_from"]), _parse_date(f["date_to"])
+    if d_from:
+        query = query.filter(AuditLog.when >= _bkk_midnight_utc(d_from))
+    if d_to:
+        query = query.filter(AuditLog.when < _bkk_midnight_utc(d_to + timedelta(days=1)))
+    if f["user_id"]:
+        query = query.filter(AuditLog.line_user_id == f["user_id"])
+    if f["group_id"]:
+        query = query.filter(AuditLog.line_group_id == f["group_id"])
+    if f["allowed"] in ("1", "0"):
+        query = query.filter(AuditLog.allowed.is_(f["allowed"] == "1"))
+    if f["q"]:
+        query = query.filter(AuditLog.query_text.like(escape_like(f["q"]) + "%", escape="\\"))
+
+    # keyset cursor: "<when ISO>|<id>" แสดงแถวที่ (when, id) น้อยกว่า cursor
+    before = request.args.get("before") or ""
+    if before:
+        try:
+            w, i = before.rsplit("|", 1)
+            query = query.filter(tuple_(AuditLog.when, AuditLog.id) < (datetime.fromisoformat(w), int(i)))
+        except ValueError:
+            before = ""
+
+    rows = query.order_by(AuditLog.when.desc(), AuditLog.id.desc()).limit(page_size + 1).all()
+    logs = rows[:page_size]
+    next_before = f"{logs[-1].when.isoformat()}|{logs[-1].id}" if len(rows) > page_size else None
+    return render_template("audit_logs.html", logs=logs, f=f, before=before, next_before=next_before,
+                           tz_bkk=ZoneInfo("Asia/Bangkok"))
+
+
 # -----------------------------
 # Vehicles
 # -----------------------------
+# คอลัมน์ที่ตารางรายการรถใช้ (ดึงเป็น tuple ไม่สร้าง ORM object)
+_VEHICLE_LIST_COLUMNS = (
+    Vehicle.id, Vehicle.license_plate, Vehicle.brand, Vehicle.model, Vehicle.owner_name,
+    Vehicle.contact_info, Vehicle.color, Vehicle.vin, Vehicle.recorded_date,
+)
+
+
 @dashboard_bp.route("/vehicles")
 @login_required
 def vehicles_list():
     q = request.args.get("q", "").strip()
-    query = Vehicle.query
+    before = request.args.get("before", type=int)  # keyset cursor: แสดงแถวที่ id < before
+    page_size = current_app.config.get("ADMIN_PAGE_SIZE", 50)
+
+    query = db.session.query(*_VEHICLE_LIST_COLUMNS)
     if q:
-        like = f"%{q}%"
-        query = query.filter(Vehicle.license_plate.ilike(like))
-    vehicles = query.order_by(Vehicle.id.desc()).limit(500).all()
-    return render_template("vehicles_list.html", vehicles=vehicles, q=q)
+        cond = plate_search_condition(q)
+        if cond is not None:
+            query = query.filter(cond)
+    if before:
+        query = query.filter(Vehicle.id < before)
+    rows = query.order_by(Vehicle.id.desc()).limit(page_size + 1).all()
+
+    # ไม่พบเลย: แสดงทะเบียนที่ใกล้เคียง (พิมพ์ผิด/อักขระคล้ายกัน) หน้าเดียว
+    fuzzy = False
+    if q and not rows and not before:
+        cond, rank = fuzzy_plate_filter(normalize_plate(q))
+        if cond is not None:
+            rows = db.session.query(*_VEHICLE_LIST_COLUMNS, Vehicle.plate_key).filter(cond).order_by(Vehicle.id.desc()).limit(page_size).all()
+            rows = rank_fuzzy(rows, rank)
+            fuzzy = bool(rows)
+
+    next_before = rows[page_size - 1].id if len(rows) > page_size else None
+    vehicles = rows[:page_size]
+    return render_template("vehicles_list.html", vehicles=vehicles, q=q,
+                           before=before, next_before=next_before, fuzzy=fuzzy)
 
 
 @dashboard_bp.route("/vehicles/add", methods=["GET", "POST"])
@@ -145,6 +284,7 @@ def vehicles_add():
         )
         db.session.add(v)
         db.session.commit()
+        plate_keys_changed(added=[v.plate_key])
         flash("เพิ่มข้อมูลสำเร็จ", "success")
         return redirect(url_for("dashboard.vehicles_list"))
     return render_template("vehicle_form.html", v=None)
@@ -155,6 +295,7 @@ def vehicles_add():
 def vehicles_edit(vid):
     v = Vehicle.query.get_or_404(vid)
     if request.method == "POST":
+        old_key = v.plate_key
         rec_date_str = (request.form.get("recorded_date") or "").strip()
         rec_date = None
         if rec_date_str:
@@ -173,6 +314,8 @@ def vehicles_edit(vid):
         v.recorded_date = rec_date or v.recorded_date
 
         db.session.commit()
+        if v.plate_key != old_key:
+            plate_keys_changed(removed=[old_key], added=[v.plate_key])
         flash("บันทึกข้อมูลสำเร็จ", "success")
         return redirect(url_for("dashboard.vehicles_list"))
     return render_template("vehicle_form.html", v=v)
@@ -182,8 +325,10 @@ def vehicles_edit(vid):
 @login_required
 def vehicles_delete(vid):
     v = Vehicle.query.get_or_404(vid)
+    key = v.plate_key
     db.session.delete(v)
     db.session.commit()
+    plate_keys_changed(removed=[key])
     flash("ลบข้อมูลแล้ว", "info")
     return redirect(url_for("dashboard.vehicles_list"))
 
@@ -197,45 +342,40 @@ def vehicles_upload():
             flash("กรุณาเลือกไฟล์ CSV", "warning")
             return redirect(url_for("dashboard.vehicles_upload"))
 
-        import csv, io
-        stream = io.StringIO(file.stream.read().decode("utf-8-sig"))
-        reader = csv.DictReader(stream)
-
-        required = {"license_plate", "brand", "model", "owner_name", "contact_info"}
-        cols = set([c.strip() for c in (reader.fieldnames or [])])
-
-        if not (cols >= required):
+        mode = request.form.get("mode") or "append"
+        if mode not in IMPORT_MODES:
+            mode = "append"
+        try:
+            result = import_vehicles_csv(
+                file.stream, chunk_size=current_app.config.get("UPLOAD_CHUNK_SIZE", 1000), mode=mode
+            )
+        except CSVHeaderError:
             flash(
                 "หัวคอลัมน์ไม่ถูกต้อง ต้องมีอย่างน้อย license_plate,brand,model,owner_name,contact_info",
                 "danger",
             )
             return redirect(url_for("dashboard.vehicles_upload"))
+        except UnicodeDecodeError:
+            flash("ไฟล์ต้องเข้ารหัสแบบ UTF-8", "danger")
+            return redirect(url_for("dashboard.vehicles_upload"))
+        if result.inserted:
+            plate_index_reload()
 
-        count = 0
-        for row in reader:
-            rd_text = (row.get("recorded_date") or "").strip()
-            rec_date = None
-            if rd_text:
-                try:
-                    rec_date = datetime.strptime(rd_text, "%Y-%m-%d").date()
-                except Exception:
-                    rec_date = None
-
-            v = Vehicle(
-                license_plate=(row.get("license_plate") or "").strip(),
-                brand=(row.get("brand") or "").strip(),
-                model=(row.get("model") or "").strip(),
-                owner_name=(row.get("owner_name") or "").strip(),
-                contact_info=(row.get("contact_info") or "").strip(),
-                color=(row.get("color") or "").strip() if "color" in cols else None,
-                vin=(row.get("vin") or "").strip() if "vin" in cols else None,
-                recorded_date=rec_date,
+        if mode == "append":
+            flash(f"อัปโหลดสำเร็จ {result.inserted} รายการ", "success")
+        else:
+            flash(
+                f"อัปโหลดสำเร็จ: เพิ่มใหม่ {result.inserted}, อัปเดต {result.updated}, "
+                f"ไม่เปลี่ยนแปลง {result.unchanged} รายการ"
+                + (f" (ทะเบียนซ้ำในไฟล์ {result.duplicates})" if result.duplicates else ""),
+                "success",
             )
-            db.session.add(v)
-            count += 1
-
-        db.session.commit()
-        flash(f"อัปโหลดสำเร็จ {count} รายการ", "success")
+        if result.rejected:
+            sample = ", ".join(f"บรรทัด {n}: {why}" for n, why in result.rejected_lines[:10])
+            flash(f"ข้ามแถวที่ไม่ถูกต้อง {result.rejected} รายการ ({sample})", "warning")
+        if result.error:
+            flash(f"หยุดนำเข้าที่ประมาณบรรทัด {result.error_line}: {result.error} — "
+                  f"บันทึกไปแล้วเฉพาะแถวก่อนหน้า กรุณาแก้ไฟล์แล้วอัปโหลดส่วนที่เหลืออีกครั้ง", "danger")
         return redirect(url_for("dashboard.vehicles_list"))
 
     return render_template("upload_form.html")
@@ -261,6 +401,7 @@ def line_users_add():
         u = LineUser(line_user_id=uid, is_active=active, display_name=dname)
         db.session.add(u)
         db.session.commit()
+        invalidate_line_user(uid)
         flash("เพิ่ม User สำเร็จ", "success")
     else:
         flash("กรุณากรอก LINE UserID", "warning")
@@ -273,6 +414,7 @@ def line_users_toggle(uid):
     u = LineUser.query.get_or_404(uid)
     u.is_active = not u.is_active
     db.session.commit()
+    invalidate_line_user(u.line_user_id)
     flash("อัปเดตสถานะแล้ว", "info")
     return redirect(url_for("dashboard.line_users_list"))
 
@@ -281,8 +423,10 @@ def line_users_toggle(uid):
 @login_required
 def line_users_delete(uid):
     u = LineUser.query.get_or_404(uid)
+    line_user_id = u.line_user_id
     db.session.delete(u)
     db.session.commit()
+    invalidate_line_user(line_user_id)
     flash("ลบ User แล้ว", "info")
     return redirect(url_for("dashboard.line_users_list"))
 
@@ -293,6 +437,7 @@ def line_users_update(uid):
     u = LineUser.query.get_or_404(uid)
     u.display_name = (request.form.get("display_name") or "").strip()
     db.session.commit()
+    invalidate_line_user(u.line_user_id)
     flash("บันทึกชื่อผู้ใช้แล้ว", "success")
     return redirect(url_for("dashboard.line_users_list"))
 
@@ -317,6 +462,7 @@ def line_groups_add():
         g = LineGroup(line_group_id=gid, is_active=active, display_name=dname)
         db.session.add(g)
         db.session.commit()
+        invalidate_line_group(gid)
         flash("เพิ่ม Group สำเร็จ", "success")
     else:
         flash("กรุณากรอก LINE GroupID", "warning")
@@ -329,6 +475,7 @@ def line_groups_toggle(gid):
     g = LineGroup.query.get_or_404(gid)
     g.is_active = not g.is_active
     db.session.commit()
+    invalidate_line_group(g.line_group_id)
     flash("อัปเดตสถานะแล้ว", "info")
     return redirect(url_for("dashboard.line_groups_list"))
 
@@ -337,8 +484,10 @@ def line_groups_toggle(gid):
 @login_required
 def line_groups_delete(gid):
     g = LineGroup.query.get_or_404(gid)
+    line_group_id = g.line_group_id
     db.session.delete(g)
     db.session.commit()
+    invalidate_line_group(line_group_id)
     flash("ลบ Group แล้ว", "info")
     return redirect(url_for("dashboard.line_groups_list"))
 
@@ -349,6 +498,7 @@ def line_groups_update(gid):
     g = LineGroup.query.get_or_404(gid)
     g.display_name = (request.form.get("display_name") or "").strip()
     db.session.commit()
+    invalidate_line_group(g.line_group_id)
     flash("บันทึกชื่อกลุ่มแล้ว", "success")
     return redirect(url_for("dashboard.line_groups_list"))
 
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# ค่าเริ่มต้นตาม dialect: gunicorn 2 worker x 4 thread + thread เบื้องหลัง (audit writer / async webhook)
+# recycle ต่ำกว่า idle timeout ของ managed DB/proxy เพื่อไม่ให้ได้ connection ที่ถูกตัดไปแล้ว
+_DIALECT_DEFAULTS = {
+    "mysql": {"pool_size": 5, "max_overflow": 5, "pool_pre_ping": True, "pool_recycle": 280, "pool_timeout": 10},
+    "postgresql": {"pool_size": 5, "max_overflow": 5, "pool_pre_ping": True, "pool_recycle": 1800, "pool_timeout": 10},
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": False, "pool_recycle": -1, "pool_timeout": 30},
+}
+
+_ENV_KEYS = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda v: v.lower() in ("1", "true", "yes")),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", int),  # engine_from_config แปลงเป็น int อยู่แล้ว
+}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool ที่จับเวลารอ connection (เวลาที่ thread ต้องรอเพราะ pool เต็ม) และนับครั้งที่ timeout"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waited = 0          # จำนวนครั้งที่ต้องรอเกิน 1 ms
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._local = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get เรียกตัวเองซ้ำได้ (กรณีแย่ง overflow) — นับเฉพาะชั้นนอกสุด
+        if getattr(self._local, "active", False):
+            return super()._do_get()
+        self._local.active = True
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._local.active = False
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += elapsed
+                if elapsed > 0.001:
+                    self.waited += 1
+                if elapsed > self.wait_max:
+                    self.wait_max = elapsed
+
+
+def engine_options(cfg) -> dict:
+    """สร้าง SQLALCHEMY_ENGINE_OPTIONS จากค่า DB_POOL_* (ว่าง = ค่าเริ่มต้นตาม dialect)"""
+    url = make_url(cfg["SQLALCHEMY_DATABASE_URI"])
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # in-memory ใช้ pool แบบ connection เดียวของ Flask-SQLAlchemy
+    opts = dict(_DIALECT_DEFAULTS.get(backend, _DIALECT_DEFAULTS["postgresql"]))
+    for opt, (key, conv) in _ENV_KEYS.items():
+        raw = cfg.get(key)
+        if raw not in (None, ""):
+            opts[opt] = conv(str(raw))
+    opts["poolclass"] = TimedQueuePool
+    return opts
+
+
+def install_sqlite_pragmas(engine, wal: bool = True, busy_timeout_ms: int = 5000):
+    """WAL ให้อ่านพร้อมเขียนได้ + busy_timeout ให้รอ lock แทนที่จะ error 'database is locked' ทันที"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+            if wal and engine.url.database not in (None, "", ":memory:"):
+                cur.execute("PRAGMA journal_mode = WAL")
+                cur.execute("PRAGMA synchronous = NORMAL")
+        finally:
+            cur.close()
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout_s": pool.timeout(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                "checkouts": pool.checkouts,
+                "waited": pool.waited,
+                "wait_total_ms": round(pool.wait_total * 1000, 1),
+                "wait_avg_ms": round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+                "wait_max_ms": round(pool.wait_max * 1000, 1),
+                "timeouts": pool.timeouts,
+            })
+    return stats
@@ -0,0 +1,51 @@
+from models import db
+
+
+def dialect_name() -> str:
+    # 'sqlite' | 'mysql' | 'postgresql'
+    return db.engine.dialect.name
+
+
+def escape_like(s: str) -> str:
+    # ใช้คู่กับ .like(..., escape="\\")
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def upsert_stmt(table, index_elements: list[str], update_set):
+    """
+    INSERT ... ON CONFLICT DO UPDATE (Postgres/SQLite) หรือ ON DUPLICATE KEY UPDATE (MySQL)
+    update_set: callable รับ "ค่าที่กำลังจะ INSERT" (excluded / inserted) แล้วคืน {คอลัมน์: expression}
+    """
+    name = dialect_name()
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        stmt = pg_insert(table)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=update_set(stmt.excluded))
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=update_set(stmt.excluded))
+    if name in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        return stmt.on_duplicate_key_update(update_set(stmt.inserted))
+    raise NotImplementedError(f"upsert not supported on {name}")
+
+
+# เวลาไทย (Asia/Bangkok) = UTC+7 ตลอดปี (ไม่มี DST) จึงบวก offset คงที่ใน SQL ได้
+BKK_UTC_OFFSET_HOURS = 7
+
+
+def bkk_day(col, name: str | None = None):
+    """
+    expression วันที่ตามเวลาไทย จากคอลัมน์ DateTime ที่เก็บเป็น UTC (รองรับ sqlite/mysql/postgresql)
+    name: ชื่อ dialect (ไม่ระบุ = ของ db.engine; ต้องระบุเมื่อไม่มี app context เช่นใน migration)
+    """
+    from sqlalchemy import func, literal_column, cast, Date
+    name = name or dialect_name()
+    h = BKK_UTC_OFFSET_HOURS
+    if name == "sqlite":
+        return func.date(col, f"+{h} hours")
+    if name in ("mysql", "mariadb"):
+        return func.date(func.date_add(col, literal_column(f"INTERVAL {h} HOUR")))
+    return cast(col + literal_column(f"INTERVAL '{h} hours'"), Date)
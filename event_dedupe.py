@@ -0,0 +1,119 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class EventDeduper:
+    """
+    กัน LINE event ซ้ำ (redelivery) ด้วย webhookEventId
+    - ชั้นแรก: ชุด id ในโปรเซส (TTL + จำกัดขนาด) ไม่มี I/O
+    - ชั้นที่สอง (ออปชัน): ไฟล์ SQLite บนเครื่องที่ทุก gunicorn worker ใช้ร่วมกัน เพราะ LINE
+      ส่งซ้ำอาจไปตก worker อื่น
+    claim() คืน True ถ้าเป็นครั้งแรกที่เห็น id นี้ (ให้ประมวลผล) / False ถ้าซ้ำ
+    """
+
+    def __init__(self, ttl: float = 3600.0, maxsize: int = 50000, shared_path: str | None = None):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self.shared_path = shared_path or None
+        self._seen: OrderedDict[str, float] = OrderedDict()  # id -> หมดอายุ (เรียงตามเวลาที่เห็น)
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._claims_since_purge = 0
+        self.claimed = 0
+        self.duplicates = 0
+        self.shared_errors = 0
+
+    # ---------- ในโปรเซส ----------
+    def _claim_local(self, event_id: str, now: float) -> bool:
+        with self._lock:
+            # TTL เท่ากันทุกตัว -> ตัวที่หมดอายุอยู่หน้าสุดเสมอ
+            while self._seen:
+                _, expires = next(iter(self._seen.items()))
+                if expires > now and len(self._seen) < self.maxsize:
+                    break
+                self._seen.popitem(last=False)
+            if event_id in self._seen:
+                return False
+            self._seen[event_id] = now + self.ttl
+            return True
+
+    # ---------- ไฟล์ที่แชร์ข้าม worker ----------
+    def _connect(self):
+        conn = sqlite3.connect(self.shared_path, timeout=2, isolation_level=None)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("CREATE TABLE IF NOT EXISTS seen_events (id TEXT PRIMARY KEY, expires REAL)")
+                    self._ready = True
+        return conn
+
+    def _claim_shared(self, event_id: str, now: float) -> bool:
+        try:
+            conn = self._connect()
+            try:
+                # เพิ่มใหม่ หรือทับแถวที่หมดอายุแล้ว; rowcount = 0 แปลว่ามี worker อื่นรับไปแล้ว
+                cur = conn.execute(
+                    "INSERT INTO seen_events (id, expires) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET expires = excluded.expires WHERE seen_events.expires < ?",
+                    (event_id, now + self.ttl, now),
+                )
+                claimed = cur.rowcount == 1
+                self._claims_since_purge += 1
+                if self._claims_since_purge >= 1000:
+                    self._claims_since_purge = 0
+                    conn.execute("DELETE FROM seen_events WHERE expires < ?", (now,))
+                return claimed
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # ไฟล์ใช้ไม่ได้: ยอมประมวลผล (ดีกว่าทิ้ง event) อาศัยชั้นในโปรเซสอย่างเดียว
+            self.shared_errors += 1
+            log.exception("event dedupe store error")
+            return True
+
+    def claim(self, event_id: str | None) -> bool:
+        if not event_id:
+            return True  # event ที่ไม่มี id (payload ทดสอบ/เก่า) ประมวลผลเสมอ
+        now = time.time()
+        ok = self._claim_local(event_id, now)
+        if ok and self.shared_path:
+            ok = self._claim_shared(event_id, now)
+        if ok:
+            self.claimed += 1
+        else:
+            self.duplicates += 1
+        return ok
+
+    def release(self, event_id: str | None):
+        """ยกเลิกการรับ id (ประมวลผลล้มเหลวและตอบ error) ให้ LINE ส่งซ้ำแล้วได้ทำใหม่"""
+        if not event_id:
+            return
+        with self._lock:
+            self._seen.pop(event_id, None)
+        if self.shared_path:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute("DELETE FROM seen_events WHERE id = ?", (event_id,))
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                self.shared_errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._seen),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "shared": bool(self.shared_path),
+            "claimed": self.claimed,
+            "duplicates": self.duplicates,
+            "shared_errors": self.shared_errors,
+        }
@@ -1,5 +1,8 @@
+import json
 from datetime import date
 
+from cache import TTLCache
+
 def format_thai_be(d: date | None) -> str:
     if not d:
         return "-"
@@ -11,7 +14,9 @@ def days_since(d: date | None) -> str:
     delta = (date.today() - d).days
     return f"{delta} วัน"
 
-def vehicle_bubble(v):
+def vehicle_bubble(v, days_text: str | None = None):
+    if days_text is None:
+        days_text = days_since(getattr(v, "recorded_date", None))
     return {
       "type": "bubble",
       "body": {
@@ -50,7 +55,7 @@ def vehicle_bubble(v):
           ]},
           {"type":"box","layout":"baseline","contents":[
             {"type":"text","text":"ผ่านมา","size":"sm","color":"#aaaaaa","flex":2},
-            {"type":"text","text": days_since(getattr(v, "recorded_date", None)), "size":"sm","wrap":True,"flex":5}
+            {"type":"text","text": days_text, "size":"sm","wrap":True,"flex":5}
           ]}
         ]
       }
@@ -61,3 +66,36 @@ def to_flex_message(vehicles):
     if len(bubbles) == 1:
         return bubbles[0]
     return {"type":"carousel","contents": bubbles}
+
+
+# ---------- bubble แบบ serialize แล้ว (แคชตาม vehicle id + updated_at) ----------
+# ค่า "ผ่านมา X วัน" เปลี่ยนทุกวัน จึงเว้นช่องไว้แล้วเติมตอนประกอบข้อความ
+_DAYS_SLOT = "@@DAYS_SINCE@@"
+_bubble_cache = TTLCache("flex_bubble", maxsize=4096, ttl=24 * 3600)
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _bubble_parts(v) -> tuple[str, str]:
+    raw = _dumps(vehicle_bubble(v, days_text=_DAYS_SLOT))
+    head, tail = raw.split(_DAYS_SLOT, 1)
+    return head, tail
+
+def vehicle_bubble_json(v) -> str:
+    key = (getattr(v, "id", None), getattr(v, "updated_at", None))
+    if key[0] is None or key[1] is None:
+        head, tail = _bubble_parts(v)
+    else:
+        head, tail = _bubble_cache.get_or_load(key, lambda: _bubble_parts(v))
+    days = _dumps(days_since(getattr(v, "recorded_date", None)))[1:-1]
+    return head + days + tail
+
+def to_flex_json(vehicles) -> str:
+    """เหมือน to_flex_message แต่คืนเป็นข้อความ JSON ที่ประกอบจาก bubble ที่แคชไว้"""
+    bubbles = [vehicle_bubble_json(v) for v in vehicles]
+    if len(bubbles) == 1:
+        return bubbles[0]
+    return '{"type":"carousel","contents":[' + ",".join(bubbles) + "]}"
+
+def flex_message_json(vehicles, alt_text: str) -> str:
+    return '{"type":"flex","altText":' + _dumps(alt_text) + ',"contents":' + to_flex_json(vehicles) + "}"
@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class LineAPIError(Exception):
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LineCircuitOpen(LineAPIError):
+    pass
+
+
+class RawJSON(str):
+    """ข้อความ JSON ที่ serialize ไว้แล้ว — ใส่ใน messages ของ reply() ได้โดยไม่ต้อง dumps ซ้ำ"""
+
+
+class CircuitBreaker:
+    """
+    ตัดวงจรเมื่อ LINE ล้มเหลวติดกัน threshold ครั้ง แล้วปฏิเสธทันทีเป็นเวลา cooldown วินาที
+    จากนั้นปล่อยให้ลอง 1 request (half-open) ถ้าสำเร็จจึงกลับมาปกติ
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    self.opens += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LineClient:
+    """
+    ไคลเอนต์ LINE Messaging API แบบ keep-alive (requests.Session + connection pool ต่อ worker)
+    - timeout แยก connect/read
+    - retry เมื่อเจอ 429/5xx หรือเชื่อมต่อไม่ได้ โดยเคารพ Retry-After และ backoff แบบทวีคูณ
+    - circuit breaker กัน thread ทั้งหมดค้างรอ LINE ตอนระบบ LINE ล่ม
+    """
+
+    def __init__(self, access_token: str, base_url: str = "https://api.line.me",
+                 connect_timeout: float = 3.0, read_timeout: float = 10.0,
+                 max_retries: int = 2, backoff: float = 0.5, max_retry_wait: float = 5.0,
+                 pool_size: int = 10, breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_retry_wait = max_retry_wait
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {access_token}"})
+
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+    def _retry_wait(self, resp, attempt: int) -> float:
+        if resp is not None:
+            ra = resp.headers.get("Retry-After")
+            if ra:
+                try:
+                    return max(0.0, float(ra))
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            self.errors += 1
+            metrics.inc("fleet_line_api_errors_total", reason="circuit_open")
+            raise LineCircuitOpen("LINE API circuit open")
+
+        url = self.base_url + path
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.requests += 1
+            metrics.inc("fleet_line_api_requests_total", method=method)
+            resp = None
+            try:
+                resp = self.session.request(method, url, **kwargs)
+                retryable = resp.status_code == 429 or resp.status_code >= 500
+                error = None
+            except requests.RequestException as e:
+                retryable = True
+                error = e
+
+            if not retryable:
+                # 4xx อื่น ๆ เป็นความผิดของ request ไม่ใช่ LINE ล่ม จึงไม่นับใน breaker
+                self.breaker.success()
+                if not resp.ok:
+                    self.errors += 1
+                    metrics.inc("fleet_line_api_errors_total", reason=str(resp.status_code))
+                    raise LineAPIError(f"LINE API {resp.status_code}: {resp.text[:200]}", resp.status_code)
+                return resp
+
+            wait = self._retry_wait(resp, attempt)
+            if attempt >= self.max_retries or wait > self.max_retry_wait:
+                self.errors += 1
+                self.breaker.failure()
+                metrics.inc("fleet_line_api_errors_total",
+                            reason="network" if error is not None else str(resp.status_code))
+                if error is not None:
+                    raise LineAPIError(f"LINE API request failed: {error}") from error
+                raise LineAPIError(f"LINE API {resp.status_code}", resp.status_code)
+
+            attempt += 1
+            self.retries += 1
+            metrics.inc("fleet_line_api_retries_total")
+            time.sleep(wait)
+
+    def reply(self, reply_token: str, messages: list):
+        body = (
+            '{"replyToken":' + json.dumps(reply_token) + ',"messages":['
+            + ",".join(m if isinstance(m, RawJSON) else json.dumps(m, ensure_ascii=False) for m in messages)
+            + "]}"
+        )
+        self.request("POST", "/v2/bot/message/reply", data=body.encode("utf-8"),
+                     headers={"Content-Type": "application/json; charset=utf-8"})
+
+    def get_display_name(self, source_type: str, user_id: str | None, group_id: str | None) -> str | None:
+        """
+        - 1:1   -> GET /v2/bot/profile/{userId}
+        - group -> GET /v2/bot/group/{groupId}/member/{userId}
+        - room  -> GET /v2/bot/room/{roomId}/member/{userId}
+        คืน None ถ้า LINE ตอบ 404 (ผู้ใช้บล็อกบอท / ออกจากกลุ่มแล้ว / ไม่ได้เป็นเพื่อน)
+        """
+        if source_type == "user" and user_id:
+            path = f"/v2/bot/profile/{user_id}"
+        elif source_type == "group" and user_id and group_id:
+            path = f"/v2/bot/group/{group_id}/member/{user_id}"
+        elif source_type == "room" and user_id and group_id:
+            path = f"/v2/bot/room/{group_id}/member/{user_id}"
+        else:
+            return None
+        try:
+            return self.request("GET", path).json().get("displayName")
+        except LineAPIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_line_client() -> LineClient:
+    """ไคลเอนต์เดียวต่อ worker (สร้างครั้งแรกที่เรียก จากค่าใน app config)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                cfg = current_app.config
+                _client = LineClient(
+                    cfg.get("LINE_CHANNEL_ACCESS_TOKEN", ""),
+                    base_url=cfg.get("LINE_API_BASE_URL", "https://api.line.me"),
+                    connect_timeout=cfg.get("LINE_CONNECT_TIMEOUT", 3.0),
+                    read_timeout=cfg.get("LINE_READ_TIMEOUT", 10.0),
+                    max_retries=cfg.get("LINE_MAX_RETRIES", 2),
+                    backoff=cfg.get("LINE_RETRY_BACKOFF", 0.5),
+                    max_retry_wait=cfg.get("LINE_MAX_RETRY_WAIT", 5.0),
+                    pool_size=cfg.get("LINE_POOL_SIZE", 10),
+                    breaker_threshold=cfg.get("LINE_BREAKER_THRESHOLD", 5),
+                    breaker_cooldown=cfg.get("LINE_BREAKER_COOLDOWN", 30.0),
+                )
+    return _client
+
+
+def line_client_stats() -> dict | None:
+    return _client.stats() if _client is not None else None
@@ -0,0 +1,85 @@
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EventDispatcher:
+    """
+    คิวงานในโปรเซส + thread pool ขนาดคงที่ สำหรับประมวลผล LINE events หลังตอบ 200 ไปแล้ว
+    - submit() คืน False เมื่อคิวเต็ม (ผู้เรียกตัดสินใจเองว่าจะทำ inline หรือทิ้ง)
+    - shutdown() รอให้งานที่ค้างในคิวเสร็จ (drain) ภายในเวลาที่กำหนด
+      เรียกจาก shutdown_background_workers (atexit ใน create_app) ก่อนปิด audit writer
+    """
+
+    def __init__(self, app, handler, threads: int = 4, maxsize: int = 200, drain_timeout: float = 10.0):
+        self.app = app
+        self.handler = handler
+        self.threads = max(1, threads)
+        self.drain_timeout = drain_timeout
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self._workers: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.threads):
+                t = threading.Thread(target=self._run, name=f"line-worker-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                with self.app.app_context():
+                    self.handler(*item)
+            except Exception:
+                log.exception("LINE worker error")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, *args) -> bool:
+        if self._closed:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(args)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self, timeout: float | None = None):
+        if self._closed:
+            return
+        self._closed = True
+        if not self._workers:
+            return
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        # ใส่ตัวหยุดต่อท้ายงานที่ค้างอยู่ เพื่อให้ worker ทำงานเก่าให้หมดก่อน
+        for _ in self._workers:
+            try:
+                self._queue.put(_STOP, timeout=max(0.01, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._workers:
+            t.join(max(0.0, deadline - time.monotonic()))
+        left = self._queue.qsize()
+        if left:
+            log.warning("LINE worker shutdown: %d events not processed", left)
@@ -1,12 +1,23 @@
-import base64, hmac, hashlib, json, requests, os
-from datetime import date
+import base64, hmac, hashlib, os, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from flask import Blueprint, request, current_app
-from models import Vehicle, LineUser, LineGroup, AuditLog, db, ensure_auditlog_columns
-from utils import has_line_permission
-from flex_templates import to_flex_message
+from models import Vehicle, LineUser, LineGroup, AuditLog, db
+from utils import resolve_line_access, prefetch_line_access, get_line_user_info, get_line_group_info
+from plate_search import normalize_plate, search_vehicles, search_vehicles_many
+from flex_templates import flex_message_json
+from line_worker import EventDispatcher
+from cache import TTLCache
+from line_client import get_line_client, LineAPIError, RawJSON
+from audit_writer import get_audit_writer, write_audit_rows, close_audit_writer
+from metrics import metrics
+from event_dedupe import EventDeduper
 
 line_bp = Blueprint("line", __name__, url_prefix="/line")
 
+# จำนวน bubble สูงสุดที่ตอบกลับต่อการค้นหา
+MAX_RESULTS = 10
+
 def _verify_signature(body: bytes, signature_header: str, channel_secret: str) -> bool:
     mac = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
     expected = base64.b64encode(mac).decode("utf-8")
@@ -18,50 +29,152 @@ def _get_max_age_days() -> int:
     except Exception:
         return 35
 
-def _fetch_line_display_name(access_token: str, source_type: str, user_id: str | None, group_id: str | None) -> str | None:
-    """
-    ดึงชื่อสมาชิกผู้พิมพ์จาก LINE
-    - 1:1   -> GET /v2/bot/profile/{userId}
-    - group -> GET /v2/bot/group/{groupId}/member/{userId}
-    - room  -> GET /v2/bot/room/{roomId}/member/{userId}
-    """
+_profile_cache = None
+_profile_cache_lock = threading.Lock()
+
+def _get_profile_cache() -> TTLCache:
+    global _profile_cache
+    if _profile_cache is None:
+        with _profile_cache_lock:
+            if _profile_cache is None:
+                cfg = current_app.config
+                _profile_cache = TTLCache(
+                    "line_display_name",
+                    maxsize=cfg.get("LINE_PROFILE_CACHE_SIZE", 5000),
+                    ttl=cfg.get("LINE_PROFILE_CACHE_TTL", 600),
+                    negative_ttl=cfg.get("LINE_PROFILE_CACHE_NEG_TTL", 60),
+                )
+    return _profile_cache
+
+def _get_line_display_name(source_type: str, user_id: str | None, group_id: str | None) -> str | None:
+    """ชื่อสมาชิกผู้พิมพ์จาก LINE ผ่านแคช (คีย์: source type, group/room id, user id)"""
+    if not user_id:
+        return None
+    key = (source_type, group_id, user_id)
+    return _get_profile_cache().get_or_load(
+        key, lambda: _fetch_line_display_name(source_type, user_id, group_id)
+    )
+
+def _fetch_line_display_name(source_type: str, user_id: str | None, group_id: str | None) -> str | None:
+    """ดึงชื่อสมาชิกผู้พิมพ์จาก LINE (ดู LineClient.get_display_name)"""
     try:
-        headers = {"Authorization": f"Bearer {access_token}"}
-        if source_type == "user" and user_id:
-            url = f"https://api.line.me/v2/bot/profile/{user_id}"
-        elif source_type == "group" and user_id and group_id:
-            url = f"https://api.line.me/v2/bot/group/{group_id}/member/{user_id}"
-        elif source_type == "room" and user_id and group_id:
-            url = f"https://api.line.me/v2/bot/room/{group_id}/member/{user_id}"
-        else:
-            return None
-        r = requests.get(url, headers=headers, timeout=6)
-        if r.ok:
-            data = r.json()
-            return data.get("displayName")
+        return get_line_client().get_display_name(source_type, user_id, group_id)
+    except LineAPIError as e:
+        # LINE ล่ม/timeout/circuit open เป็นเรื่องปกติของบริการภายนอก ไม่ต้องมี stack trace
+        current_app.logger.warning("fetch display name failed: %s", e)
     except Exception:
         current_app.logger.exception("fetch display name error")
     return None
 
-def _write_log(source_type, user_id, group_id, text, matched=None, allowed=True,
-               actor_display_name=None, context_display_name=None):
+def _log_row(source_type, user_id, group_id, text, matched=None, allowed=True,
+             actor_display_name=None, context_display_name=None) -> dict:
+    return dict(
+        when=datetime.utcnow(),
+        source_type=source_type,
+        line_user_id=user_id,
+        line_group_id=group_id,
+        query_text=(text or "")[:255],
+        matched=matched,
+        allowed=allowed,
+        actor_display_name=actor_display_name,
+        context_display_name=context_display_name,
+    )
+
+def _write_log(*args, **kwargs):
+    _write_logs([_log_row(*args, **kwargs)])
+
+def _write_logs(rows: list[dict]):
+    # โหมดบัฟเฟอร์: เขียนเป็นชุดใน thread เบื้องหลัง ไม่ถ่วงเวลาตอบกลับ
+    if current_app.config.get("AUDIT_BUFFER_ENABLED"):
+        for row in rows:
+            get_audit_writer().add(row)
+        return
     try:
-        log = AuditLog(
-            source_type=source_type,
-            line_user_id=user_id,
-            line_group_id=group_id,
-            query_text=(text or "")[:255],
-            matched=matched,
-            allowed=allowed,
-            actor_display_name=actor_display_name,
-            context_display_name=context_display_name,
-        )
-        db.session.add(log)
-        db.session.commit()
+        write_audit_rows(rows)
     except Exception:
         db.session.rollback()
         current_app.logger.exception("audit log error")
 
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def _get_dispatcher() -> EventDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                cfg = current_app.config
+                _dispatcher = EventDispatcher(
+                    current_app._get_current_object(),
+                    _process_events,
+                    threads=cfg.get("LINE_WORKER_THREADS", 4),
+                    maxsize=cfg.get("LINE_QUEUE_MAXSIZE", 200),
+                    drain_timeout=cfg.get("LINE_DRAIN_TIMEOUT", 10.0),
+                )
+    return _dispatcher
+
+def shutdown_background_workers():
+    """
+    ปิดงานเบื้องหลังของโปรเซสตามลำดับที่แน่นอน (ลงทะเบียน atexit ครั้งเดียวใน create_app):
+    drain คิว LINE ก่อน เพื่อให้ audit ของ event ที่ค้างยังเข้าบัฟเฟอร์ได้ แล้วจึงปิด audit writer และ flush metrics
+    """
+    if _dispatcher is not None:
+        _dispatcher.shutdown()
+    close_audit_writer()
+    try:
+        metrics.flush()
+    except OSError:
+        pass
+
+_deduper = None
+_deduper_lock = threading.Lock()
+
+def _get_deduper() -> EventDeduper | None:
+    global _deduper
+    if not current_app.config.get("LINE_DEDUPE_ENABLED", True):
+        return None
+    if _deduper is None:
+        with _deduper_lock:
+            if _deduper is None:
+                cfg = current_app.config
+                shared = None
+                if cfg.get("LINE_DEDUPE_STORE", "memory") == "file":
+                    shared = cfg.get("LINE_DEDUPE_PATH") or os.path.join(tempfile.gettempdir(), "spf_line_events.sqlite")
+                _deduper = EventDeduper(
+                    ttl=cfg.get("LINE_DEDUPE_TTL", 3600),
+                    maxsize=cfg.get("LINE_DEDUPE_SIZE", 50000),
+                    shared_path=shared,
+                )
+    return _deduper
+
+def line_dedupe_stats() -> dict | None:
+    return _deduper.stats() if _deduper is not None else None
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def _get_batch_pool() -> ThreadPoolExecutor:
+    global _batch_pool
+    if _batch_pool is None:
+        with _batch_pool_lock:
+            if _batch_pool is None:
+                _batch_pool = ThreadPoolExecutor(
+                    max_workers=max(1, current_app.config.get("LINE_BATCH_THREADS", 8)),
+                    thread_name_prefix="line-batch",
+                )
+    return _batch_pool
+
+def _run_concurrently(fn, items: list) -> list:
+    """เรียก fn(*item) ทุก item พร้อมกัน (thread ละ app context) คืนผลตามลำดับ item"""
+    if len(items) <= 1:
+        return [fn(*item) for item in items]
+    app = current_app._get_current_object()
+
+    def call(item):
+        with app.app_context():
+            return fn(*item)
+    return list(_get_batch_pool().map(call, items))
+
 @line_bp.route("/webhook", methods=["POST"])
 def webhook():
     channel_secret = current_app.config.get("LINE_CHANNEL_SECRET", "")
@@ -69,119 +182,234 @@ def webhook():
     if not channel_secret or not access_token:
         return "LINE config missing", 500
 
-    # ตรวจและเพิ่มคอลัมน์ใหม่ของ audit_logs ถ้ายังไม่มี
-    try:
-        ensure_auditlog_columns()
-    except Exception:
-        current_app.logger.exception("ensure_auditlog_columns failed")
+    with metrics.time("fleet_webhook_request_seconds"):
+        return _webhook(channel_secret)
 
+def _webhook(channel_secret: str):
     body = request.get_data()
     signature = request.headers.get("X-Line-Signature", "")
-    if not _verify_signature(body, signature, channel_secret):
+    with metrics.time("fleet_webhook_stage_seconds", stage="signature"):
+        valid = _verify_signature(body, signature, channel_secret)
+    if not valid:
+        metrics.inc("fleet_webhook_events_total", type="payload", outcome="bad_signature")
         return "Bad signature", 400
 
     payload = request.get_json(silent=True) or {}
     events = payload.get("events", [])
 
+    dispatcher = _get_dispatcher() if current_app.config.get("LINE_ASYNC_WEBHOOK") else None
+    deduper = _get_deduper()
+    accepted = []
     for ev in events:
-        if ev.get("type") != "message": 
-            continue
-        if ev["message"].get("type") != "text":
+        # event ที่เคยรับแล้ว (LINE ส่งซ้ำ): ตอบ 200 โดยไม่แตะ DB และไม่เรียก LINE
+        event_id = ev.get("webhookEventId")
+        redelivery = bool((ev.get("deliveryContext") or {}).get("isRedelivery"))
+        if deduper is not None and not deduper.claim(event_id):
+            metrics.inc("fleet_webhook_duplicate_events_total", redelivery=str(redelivery).lower())
             continue
+        if redelivery:
+            metrics.inc("fleet_webhook_redelivered_events_total")
+        accepted.append(ev)
+    if not accepted:
+        return "ok"
 
-        source = ev.get("source", {})
-        stype = source.get("type")          # 'user' | 'group' | 'room'
-        user_id = source.get("userId")
-        group_id = source.get("groupId") if stype in ("group", "room") else None
+    # โหมด async: ใส่คิวทั้งชุดแล้วตอบ 200 ทันที ถ้าคิวเต็มให้ทำ inline แทน (ไม่ทิ้ง event)
+    if dispatcher is not None and dispatcher.submit(accepted):
+        return "ok"
+    try:
+        _process_events(accepted)
+    except Exception:
+        # จะตอบ 500 -> LINE ส่งซ้ำ ต้องให้รอบนั้นได้ประมวลผลใหม่
+        if deduper is not None:
+            for ev in accepted:
+                deduper.release(ev.get("webhookEventId"))
+        raise
 
-        text = (ev["message"].get("text") or "").strip()
-        lower = text.lower()
+    return "ok"
 
-        # ---------- คำสั่งสาธารณะ (ไม่ลง log การค้นหา) ----------
-        if lower == "/userid":
-            if user_id:
-                rec = LineUser.query.filter_by(line_user_id=user_id).first()
-                dname = rec.display_name if rec and rec.display_name else None
-                msg = f"UserID ของคุณ: {user_id}\n" + (f"ชื่อที่ตั้งค่า: {dname}" if dname else "(ยังไม่ได้ตั้งชื่อ)")
-            else:
-                msg = "ไม่พบ UserID"
-            _reply(access_token, ev["replyToken"], [{"type": "text", "text": msg}])
-            continue
+def _process_events(events: list[dict]):
+    """ประมวลผล events ของ payload เดียว: ถ้ามีข้อความตั้งแต่ 2 event ขึ้นไปใช้ทาง batch"""
+    parsed = [(ev, _parse_message(ev)) for ev in events]
+    batch = [(ev, msg) for ev, msg in parsed if msg is not None]
+    if len(batch) < 2 or not current_app.config.get("LINE_BATCH_ENABLED", True):
+        for ev in events:
+            _process_event(ev)
+        return
 
-        if lower == "/groupid":
-            if group_id:
-                rec = LineGroup.query.filter_by(line_group_id=group_id).first()
-                dname = rec.display_name if rec and rec.display_name else None
-                msg = f"GroupID ของห้องนี้: {group_id}\n" + (f"ชื่อที่ตั้งค่า: {dname}" if dname else "(ยังไม่ได้ตั้งชื่อ)")
-            else:
-                msg = "คำสั่งนี้ใช้ได้ในกลุ่ม/ห้องเท่านั้น — เชิญบอทเข้ากลุ่มแล้วพิมพ์ /groupid อีกครั้ง"
-            _reply(access_token, ev["replyToken"], [{"type": "text", "text": msg}])
-            continue
-        # ---------------------------------------------------------
+    for ev, msg in parsed:
+        if msg is None:
+            metrics.inc("fleet_webhook_events_total", type=ev.get("type") or "unknown", outcome="ignored")
+    try:
+        outcomes = _handle_batch(batch)
+    except Exception:
+        metrics.inc("fleet_webhook_events_total", len(batch), type="message", outcome="error")
+        raise
+    for outcome in outcomes:
+        metrics.inc("fleet_webhook_events_total", type="message", outcome=outcome)
+
+def _process_event(ev: dict):
+    """_handle_event + นับผลลัพธ์ตามชนิด event (ใช้ทั้งโหมดปกติและ async)"""
+    etype = ev.get("type") or "unknown"
+    try:
+        outcome = _handle_event(ev)
+    except Exception:
+        metrics.inc("fleet_webhook_events_total", type=etype, outcome="error")
+        raise
+    metrics.inc("fleet_webhook_events_total", type=etype, outcome=outcome)
+
+def _parse_message(ev: dict) -> tuple | None:
+    """event ข้อความ -> (source type, user id, group id, ข้อความ) หรือ None ถ้าไม่ต้องประมวลผล"""
+    if ev.get("type") != "message":
+        return None
+    if ev["message"].get("type") != "text":
+        return None
+
+    source = ev.get("source", {})
+    stype = source.get("type")          # 'user' | 'group' | 'room'
+    user_id = source.get("userId")
+    group_id = source.get("groupId") if stype in ("group", "room") else None
+    return stype, user_id, group_id, (ev["message"].get("text") or "").strip()
+
+def _command_reply(text: str, user_id: str | None, group_id: str | None) -> tuple[str, str] | None:
+    """คำสั่งสาธารณะ (ไม่ลง log การค้นหา) -> (ผลลัพธ์, ข้อความตอบ) หรือ None ถ้าไม่ใช่คำสั่ง"""
+    lower = text.lower()
+    if lower == "/userid":
+        if user_id:
+            dname = get_line_user_info(user_id)[2]
+            msg = f"UserID ของคุณ: {user_id}\n" + (f"ชื่อที่ตั้งค่า: {dname}" if dname else "(ยังไม่ได้ตั้งชื่อ)")
+        else:
+            msg = "ไม่พบ UserID"
+        return "userid", msg
+
+    if lower == "/groupid":
+        if group_id:
+            dname = get_line_group_info(group_id)[2]
+            msg = f"GroupID ของห้องนี้: {group_id}\n" + (f"ชื่อที่ตั้งค่า: {dname}" if dname else "(ยังไม่ได้ตั้งชื่อ)")
+        else:
+            msg = "คำสั่งนี้ใช้ได้ในกลุ่ม/ห้องเท่านั้น — เชิญบอทเข้ากลุ่มแล้วพิมพ์ /groupid อีกครั้ง"
+        return "groupid", msg
+    return None
+
+_DENIED_TEXT = "คุณไม่มีสิทธิ์ใช้งานระบบนี้ กรุณาติดต่อผู้ดูแล"
 
-        # ชื่อที่ตั้งค่าจากระบบ (context)
-        user_rec = LineUser.query.filter_by(line_user_id=user_id).first() if user_id else None
-        group_rec = LineGroup.query.filter_by(line_group_id=group_id).first() if group_id else None
-        context_name = (user_rec.display_name if (stype == "user" and user_rec and user_rec.display_name) else
-                        group_rec.display_name if (stype in ("group","room") and group_rec and group_rec.display_name) else
-                        None)
+def _result_messages(fresh: list, max_age: int, fuzzy: bool = False) -> tuple[str, list]:
+    if not fresh:
+        return "not_found", [{"type": "text", "text": f"ไม่พบข้อมูลทะเบียนที่ค้นหา หรือข้อมูลเกิน {max_age} วันแล้ว"}]
+    if fuzzy:
+        # ทะเบียนใกล้เคียง (พิมพ์ผิด?) — แจ้งให้ชัดก่อน Flex เพื่อไม่ให้เข้าใจว่าเป็นทะเบียนที่ตรงกัน
+        return "fuzzy", [
+            {"type": "text", "text": f"ไม่พบทะเบียนที่ตรงกัน — หมายถึงทะเบียนเหล่านี้หรือไม่? (ใกล้เคียง {len(fresh)} รายการ)"},
+            RawJSON(flex_message_json(fresh, f"ทะเบียนใกล้เคียง {len(fresh)} รายการ")),
+        ]
+    # เฉพาะ Flex (ประกอบจาก bubble ที่ serialize และแคชไว้แล้ว)
+    return "found", [RawJSON(flex_message_json(fresh, f"ผลการค้นหา {len(fresh)} รายการ"))]
 
-        # ชื่อสมาชิกผู้พิมพ์จาก LINE
-        actor_name = _fetch_line_display_name(access_token, stype, user_id, group_id)
+def _handle_event(ev: dict) -> str:
+    """ประมวลผล event เดียว (ค้นหา, ตรวจสิทธิ์, log, ตอบกลับ) คืนผลลัพธ์สำหรับ metrics"""
+    parsed = _parse_message(ev)
+    if parsed is None:
+        return "ignored"
+    stype, user_id, group_id, text = parsed
 
-        # ตรวจสิทธิ์
-        if not has_line_permission(user_id, group_id):
+    command = _command_reply(text, user_id, group_id)
+    if command is not None:
+        _reply(ev["replyToken"], [{"type": "text", "text": command[1]}])
+        return command[0]
+
+    # สิทธิ์ + ชื่อที่ตั้งค่าจากระบบ (context) จากการค้นครั้งเดียว (แคช)
+    with metrics.time("fleet_webhook_stage_seconds", stage="permission"):
+        allowed, context_name = resolve_line_access(stype, user_id, group_id)
+
+    # ชื่อสมาชิกผู้พิมพ์จาก LINE
+    with metrics.time("fleet_webhook_stage_seconds", stage="display_name"):
+        actor_name = _get_line_display_name(stype, user_id, group_id)
+
+    # ตรวจสิทธิ์
+    if not allowed:
+        with metrics.time("fleet_webhook_stage_seconds", stage="audit"):
             _write_log(stype, user_id, group_id, text, matched=None, allowed=False,
                        actor_display_name=actor_name, context_display_name=context_name)
-            _reply(access_token, ev["replyToken"], [{"type": "text", "text": "คุณไม่มีสิทธิ์ใช้งานระบบนี้ กรุณาติดต่อผู้ดูแล"}])
-            continue
+        _reply(ev["replyToken"], [{"type": "text", "text": _DENIED_TEXT}])
+        return "denied"
 
-        # ค้นหา
-        like = f"%{text}%"
-        candidates = (
-            Vehicle.query.filter(Vehicle.license_plate.ilike(like))
-            .order_by(Vehicle.id.desc())
-            .limit(20)
-            .all()
-        )
-
-        # กรองอายุ
-        max_age = _get_max_age_days()
-        today = date.today()
-        fresh = []
-        for v in candidates:
-            rd = getattr(v, "recorded_date", None)
-            if rd is None:
-                continue
-            if (today - rd).days <= max_age:
-                fresh.append(v)
-
-        # Log
-        _write_log(stype, user_id, group_id, text, matched=len(fresh), allowed=True,
+    # ค้นหา (กรองอายุข้อมูลใน SQL: recorded_date >= วันนี้ - max_age)
+    max_age = _get_max_age_days()
+    cutoff = date.today() - timedelta(days=max_age)
+    with metrics.time("fleet_webhook_stage_seconds", stage="search"):
+        fresh, fuzzy = search_vehicles(text, limit=MAX_RESULTS, min_recorded_date=cutoff)
+
+    # Log (ทะเบียนใกล้เคียงนับเป็นไม่พบ: matched=0)
+    with metrics.time("fleet_webhook_stage_seconds", stage="audit"):
+        _write_log(stype, user_id, group_id, text, matched=0 if fuzzy else len(fresh), allowed=True,
                    actor_display_name=actor_name, context_display_name=context_name)
 
-        if not fresh:
-            _reply(access_token, ev["replyToken"], [
-                {"type": "text", "text": f"ไม่พบข้อมูลทะเบียนที่ค้นหา หรือข้อมูลเกิน {max_age} วันแล้ว"}
-            ])
+    outcome, messages = _result_messages(fresh, max_age, fuzzy)
+    _reply(ev["replyToken"], messages)
+    return outcome
+
+def _handle_batch(batch: list[tuple[dict, tuple]]) -> list[str]:
+    """
+    หลาย event ข้อความใน payload เดียว: จำนวน round-trip คงที่ไม่ขึ้นกับจำนวน event
+    - สิทธิ์: IN (...) หนึ่ง query ต่อ user / group (เฉพาะที่ไม่อยู่ในแคช)
+    - ค้นหา: search_vehicles_many (ไม่เกิน 2 query), audit log: INSERT ชุดเดียว
+    - ชื่อสมาชิกจาก LINE และการตอบกลับ: เรียกพร้อมกันใน thread pool
+    คืนผลลัพธ์ของแต่ละ event ตามลำดับ (สำหรับ metrics)
+    """
+    n = len(batch)
+    outcomes: list[str | None] = [None] * n
+    replies: list[list | None] = [None] * n
+
+    with metrics.time("fleet_webhook_stage_seconds", stage="permission"):
+        prefetch_line_access([m[1] for _, m in batch], [m[2] for _, m in batch])
+        searches = []
+        for i, (ev, (stype, user_id, group_id, text)) in enumerate(batch):
+            command = _command_reply(text, user_id, group_id)
+            if command is not None:
+                outcomes[i] = command[0]
+                replies[i] = [{"type": "text", "text": command[1]}]
+            else:
+                searches.append(i)
+        access = {i: resolve_line_access(*batch[i][1][:3]) for i in searches}
+
+    with metrics.time("fleet_webhook_stage_seconds", stage="display_name"):
+        name_keys = list(dict.fromkeys(batch[i][1][:3] for i in searches))
+        names = dict(zip(name_keys, _run_concurrently(_get_line_display_name, name_keys)))
+
+    max_age = _get_max_age_days()
+    cutoff = date.today() - timedelta(days=max_age)
+    with metrics.time("fleet_webhook_stage_seconds", stage="search"):
+        found, fuzzy_keys = search_vehicles_many([batch[i][1][3] for i in searches if access[i][0]],
+                                     limit=MAX_RESULTS, min_recorded_date=cutoff)
+
+    rows = []
+    for i in searches:
+        stype, user_id, group_id, text = batch[i][1]
+        allowed, context_name = access[i]
+        actor_name = names.get((stype, user_id, group_id))
+        if not allowed:
+            rows.append(_log_row(stype, user_id, group_id, text, matched=None, allowed=False,
+                                 actor_display_name=actor_name, context_display_name=context_name))
+            outcomes[i], replies[i] = "denied", [{"type": "text", "text": _DENIED_TEXT}]
             continue
+        key = normalize_plate(text)
+        fresh, fuzzy = found.get(key, []), key in fuzzy_keys
+        rows.append(_log_row(stype, user_id, group_id, text, matched=0 if fuzzy else len(fresh), allowed=True,
+                             actor_display_name=actor_name, context_display_name=context_name))
+        outcomes[i], replies[i] = _result_messages(fresh, max_age, fuzzy)
 
-        # เฉพาะ Flex
-        flex = to_flex_message(fresh[:10])
-        _reply(access_token, ev["replyToken"], [{
-            "type": "flex",
-            "altText": f"ผลการค้นหา {len(fresh[:10])} รายการ",
-            "contents": flex
-        }])
+    if rows:
+        with metrics.time("fleet_webhook_stage_seconds", stage="audit"):
+            _write_logs(rows)
 
-    return "ok"
+    _run_concurrently(_reply, [(ev["replyToken"], replies[i]) for i, (ev, _) in enumerate(batch)])
+    return outcomes
 
-def _reply(access_token: str, reply_token: str, messages: list):
-    url = "https://api.line.me/v2/bot/message/reply"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    data = {"replyToken": reply_token, "messages": messages}
+def _reply(reply_token: str, messages: list):
     try:
-        r = requests.post(url, headers=headers, data=json.dumps(data), timeout=10)
-        r.raise_for_status()
+        with metrics.time("fleet_webhook_stage_seconds", stage="reply"):
+            get_line_client().reply(reply_token, messages)
+    except LineAPIError as e:
+        # เหมือน _fetch_line_display_name: LINE ล่ม/circuit open ไม่ต้องมี stack trace ทุก event
+        current_app.logger.warning("LINE reply failed: %s", e)
     except Exception as e:
         current_app.logger.exception("LINE reply error: %s", e)
@@ -0,0 +1,282 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# วินาที (ตามแบบ Prometheus client)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ชื่อ metric -> (ชนิด, คำอธิบาย) — render ตามลำดับนี้
+METRICS = {
+    "fleet_webhook_request_seconds": ("histogram", "Total time spent in the LINE webhook handler."),
+    "fleet_webhook_stage_seconds": ("histogram", "Time spent per webhook stage."),
+    "fleet_webhook_events_total": ("counter", "LINE webhook events by type and outcome."),
+    "fleet_webhook_duplicate_events_total": ("counter", "Duplicate LINE events acknowledged without processing."),
+    "fleet_webhook_redelivered_events_total": ("counter", "Redelivered LINE events processed for the first time."),
+    "fleet_line_api_requests_total": ("counter", "HTTP requests sent to the LINE API (including retries)."),
+    "fleet_line_api_retries_total": ("counter", "LINE API requests retried after 429/5xx/network errors."),
+    "fleet_line_api_errors_total": ("counter", "Failed LINE API calls by reason."),
+}
+
+
+# worker ที่ว่างยังเขียนไฟล์ซ้ำทุก _HEARTBEAT_FLUSHES รอบ; ไฟล์ที่ไม่ถูกเขียนนานกว่า _STALE_FLUSHES รอบ
+# (หรือ PID ตายแล้ว) ถือเป็นของ worker ที่จบไปแล้ว -> ย้ายค่าไปรวมใน _ACCUMULATED แล้วลบไฟล์
+# (counter/histogram ต้องไม่ลดลง ไม่เช่นนั้น Prometheus จะเห็นเป็น counter reset)
+_HEARTBEAT_FLUSHES = 10
+_STALE_FLUSHES = 30
+_ACCUMULATED = "accumulated.json"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # มีอยู่แต่ไม่มีสิทธิ์ส่ง signal
+    return True
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _sum_snapshots(snapshots, buckets: tuple) -> tuple[dict, dict]:
+    counters: dict[tuple, float] = {}
+    hists: dict[tuple, list] = {}
+    for snap in snapshots:
+        if tuple(snap.get("buckets", ())) != buckets:
+            continue
+        for n, l, v in snap["c"]:
+            k = (n, tuple(map(tuple, l)))
+            counters[k] = counters.get(k, 0.0) + v
+        for n, l, counts, s, c in snap["h"]:
+            k = (n, tuple(map(tuple, l)))
+            h = hists.get(k)
+            if h is None:
+                hists[k] = [list(counts), s, c]
+            else:
+                h[0] = [a + b for a, b in zip(h[0], counts)]
+                h[1] += s
+                h[2] += c
+    return counters, hists
+
+
+def _read_snapshot(path: str) -> dict | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(directory: str, path: str, data: dict):
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class MetricsRegistry:
+    """
+    ตัวเก็บ metric ต่อโปรเซส: counter + histogram ใน dict เดียว ล็อกสั้น ๆ ตอนบวกค่า (ไม่มี I/O ใน request)
+    ถ้ากำหนด directory: thread เบื้องหลังเขียน snapshot ของ worker นี้ลงไฟล์ทุก flush_interval วินาที
+    และ /metrics รวมไฟล์ของทุก worker (gunicorn) ก่อนแสดงผล
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: dict[tuple, float] = {}
+        self._hists: dict[tuple, list] = {}  # key -> [counts ต่อ bucket (+Inf ท้ายสุด), sum, count]
+        self._dirty = False
+        self.directory = None
+        self.flush_interval = 1.0
+        self._thread = None
+
+    # ---------- บันทึกค่า ----------
+    def inc(self, name: str, value: float = 1.0, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0.0) + value
+            self._dirty = True
+
+    def observe(self, name: str, seconds: float, **labels):
+        k = _key(name, labels)
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._hists.get(k)
+            if h is None:
+                h = self._hists[k] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += seconds
+            h[2] += 1
+            self._dirty = True
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # ---------- รวมข้าม worker ----------
+    def configure(self, directory: str | None, flush_interval: float = 1.0):
+        self.flush_interval = max(0.1, flush_interval)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory or None
+        if self.directory and os.path.exists(self._path()):
+            # ไฟล์ของโปรเซสก่อนหน้าที่ได้ PID เดียวกัน: เก็บค่าไว้ก่อนถูกเขียนทับ
+            self._fold(self._path())
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"worker-{os.getpid()}.json")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._dirty = False
+            return {
+                "buckets": list(self.buckets),
+                "c": [[n, list(l), v] for (n, l), v in self._counters.items()],
+                "h": [[n, list(l), list(h[0]), h[1], h[2]] for (n, l), h in self._hists.items()],
+            }
+
+    def flush(self):
+        if not self.directory:
+            return
+        _write_snapshot(self.directory, self._path(), self.snapshot())
+
+    def _fold(self, path: str):
+        """ย้ายค่าในไฟล์ของ worker ที่จบแล้วไปรวมใน accumulated.json แล้วลบไฟล์ (ล็อกข้ามโปรเซส กันนับซ้ำ)"""
+        try:
+            with open(os.path.join(self.directory, _ACCUMULATED + ".lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                snap = _read_snapshot(path)
+                if snap is None:
+                    return  # worker อื่นย้ายไปแล้ว
+                acc_path = os.path.join(self.directory, _ACCUMULATED)
+                acc = _read_snapshot(acc_path)
+                counters, hists = _sum_snapshots([s for s in (acc, snap) if s], self.buckets)
+                _write_snapshot(self.directory, acc_path, {
+                    "buckets": list(self.buckets),
+                    "c": [[n, list(l), v] for (n, l), v in counters.items()],
+                    "h": [[n, list(l), h[0], h[1], h[2]] for (n, l), h in hists.items()],
+                })
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self):
+        idle = 0
+        while True:
+            time.sleep(self.flush_interval)
+            idle += 1
+            if self._dirty or idle >= _HEARTBEAT_FLUSHES:
+                idle = 0
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+    def _is_stale(self, path: str, now: float) -> bool:
+        try:
+            pid = int(os.path.basename(path)[len("worker-"):-len(".json")])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return False
+        try:
+            if now - os.path.getmtime(path) > _STALE_FLUSHES * self.flush_interval:
+                return True
+        except OSError:
+            return False
+        return not _pid_alive(pid)
+
+    def ensure_flusher(self):
+        # เริ่ม thread หลัง fork (เรียกตอน request แรกของแต่ละ worker)
+        if self.directory and (self._thread is None or not self._thread.is_alive()):
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def collect(self) -> tuple[dict, dict]:
+        """รวม counter/histogram ของทุก worker (หรือของโปรเซสนี้อย่างเดียวถ้าไม่มี directory)"""
+        if self.directory:
+            self.flush()
+            now = time.time()
+            for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+                if self._is_stale(path, now):
+                    self._fold(path)
+            snapshots = []
+            # ไฟล์กำลังถูกเขียน/เสีย -> ข้ามรอบนี้
+            for path in glob.glob(os.path.join(self.directory, "worker-*.json")) + [
+                    os.path.join(self.directory, _ACCUMULATED)]:
+                snap = _read_snapshot(path)
+                if snap is not None:
+                    snapshots.append(snap)
+        else:
+            snapshots = [self.snapshot()]
+        return _sum_snapshots(snapshots, self.buckets)
+
+    # ---------- Prometheus text format ----------
+    def render(self) -> str:
+        counters, hists = self.collect()
+        lines = []
+        for name, (mtype, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+            if mtype == "counter":
+                for (n, labels), v in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+            else:
+                for (n, labels), (counts, total, count) in sorted(hists.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for le, c in zip(self.buckets + (float("inf"),), counts):
+                        cumulative += c
+                        le_text = "+Inf" if le == float("inf") else repr(le)
+                        lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', le_text),))} {cumulative}")
+                    lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(total)}")
+                    lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(v)
+
+
+# registry เดียวต่อโปรเซส
+metrics = MetricsRegistry()
+
+
+def init_metrics(app):
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    directory = app.config.get("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "spf_metrics")
+    try:
+        metrics.configure(directory, app.config.get("METRICS_FLUSH_INTERVAL", 1.0))
+    except OSError:
+        app.logger.warning("metrics directory %s not writable; /metrics shows this worker only", directory)
+        metrics.configure(None)
@@ -0,0 +1,220 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Column, Index, MetaData, Table, inspect, select, func, insert, text
+from sqlalchemy.exc import DBAPIError
+
+from models import db, SchemaVersion
+
+log = logging.getLogger(__name__)
+
+
+def _add_columns(engine, table: str, columns: list[tuple[str, str]]):
+    insp = inspect(engine)
+    if table not in insp.get_table_names():
+        return
+    existing = {c["name"] for c in insp.get_columns(table)}
+    for name, dtype in columns:
+        if name in existing:
+            continue
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {dtype}"
+        if engine.dialect.name == "mysql":
+            ddl += " NULL"
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(ddl)
+        except DBAPIError:
+            # worker อื่นเพิ่มคอลัมน์นี้ไปก่อนระหว่าง inspect กับ ALTER
+            if name not in {c["name"] for c in inspect(engine).get_columns(table)}:
+                raise
+
+
+def _create_indexes(engine, model):
+    # สร้างผ่าน SQLAlchemy เพื่อให้ quote ชื่อคอลัมน์ (เช่น `when`) ถูกตาม dialect
+    existing = {i["name"] for i in inspect(engine).get_indexes(model.__tablename__)}
+    for index in model.__table__.indexes:
+        if index.name in existing:
+            continue
+        try:
+            index.create(engine)
+        except DBAPIError:
+            if index.name not in {i["name"] for i in inspect(engine).get_indexes(model.__tablename__)}:
+                raise
+
+
+def _drop_indexes(engine, table: str, indexes: list[tuple[str, str]]):
+    # index ที่ถูกแทนด้วย composite index แล้ว: ลบเฉพาะที่มีอยู่ (MySQL ไม่มี DROP INDEX IF EXISTS)
+    # ใช้ Table ชั่วคราวเพื่อให้ SQLAlchemy ออก DDL ตาม dialect (MySQL ต้องมี ON <table>)
+    existing = {i["name"] for i in inspect(engine).get_indexes(table)}
+    for name, column in indexes:
+        if name not in existing:
+            continue
+        try:
+            Index(name, Table(table, MetaData(), Column(column)).c[column]).drop(engine)
+        except DBAPIError:
+            if name in {i["name"] for i in inspect(engine).get_indexes(table)}:
+                raise
+
+
+_LOCK_KEY = 720_017  # คีย์ advisory lock ของการ migrate (ค่าคงที่ใดก็ได้ที่ไม่ชนกับระบบอื่น)
+
+
+@contextmanager
+def _migration_lock(engine):
+    """
+    กันหลาย gunicorn worker migrate พร้อมกันตอนบูต (Postgres advisory lock / MySQL GET_LOCK)
+    SQLite ไม่มีล็อกระดับนี้ — อาศัยให้ทุกขั้นทนต่อ "มีอยู่แล้ว" แทน
+    """
+    dialect = engine.dialect.name
+    if dialect not in ("postgresql", "mysql"):
+        yield
+        return
+    with engine.connect() as conn:
+        if dialect == "postgresql":
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_KEY})
+        else:
+            conn.execute(text("SELECT GET_LOCK(:k, 300)"), {"k": f"schema_migrate_{_LOCK_KEY}"})
+        conn.commit()
+        try:
+            yield
+        finally:
+            if dialect == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+            else:
+                conn.execute(text("SELECT RELEASE_LOCK(:k)"), {"k": f"schema_migrate_{_LOCK_KEY}"})
+            conn.commit()
+
+
+# ---------- ขั้นตอน migration (เรียงตามเวอร์ชัน; ทุกขั้นต้องรันซ้ำบนฐานที่มีอยู่แล้วได้) ----------
+
+def _m1_create_tables(engine):
+    try:
+        db.metadata.create_all(engine)
+    except DBAPIError:
+        db.metadata.create_all(engine)  # worker อื่นสร้างบางตารางไปพร้อมกัน: รอบสองข้ามตารางที่มีแล้ว
+
+
+def _m2_vehicle_details(engine):
+    _add_columns(engine, "vehicles", [("color", "VARCHAR(64)"), ("vin", "VARCHAR(64)"), ("recorded_date", "DATE")])
+
+
+def _m3_line_display_names(engine):
+    _add_columns(engine, "line_users", [("display_name", "VARCHAR(128)")])
+    _add_columns(engine, "line_groups", [("display_name", "VARCHAR(128)")])
+
+
+def _m4_audit_display_names(engine):
+    typ = "TEXT" if engine.dialect.name == "sqlite" else "VARCHAR(120)"
+    _add_columns(engine, "audit_logs", [("actor_display_name", typ), ("context_display_name", typ)])
+
+
+def _m5_vehicle_search_keys(engine):
+    from models import Vehicle
+    _add_columns(engine, "vehicles", [("plate_key", "VARCHAR(64)"), ("dedupe_key", "VARCHAR(160)")])
+    _create_indexes(engine, Vehicle)
+
+
+def _m6_audit_keyset_indexes(engine):
+    from models import AuditLog
+    _create_indexes(engine, AuditLog)
+
+
+def _m7_drop_superseded_indexes(engine):
+    _drop_indexes(engine, "vehicles", [("ix_vehicles_plate_key", "plate_key")])
+    _drop_indexes(engine, "audit_logs", [
+        ("ix_audit_logs_when", "when"),
+        ("ix_audit_logs_line_user_id", "line_user_id"),
+        ("ix_audit_logs_line_group_id", "line_group_id"),
+    ])
+
+
+def _m8_backfill_search_stats(engine):
+    # ตารางสรุปรายวันเริ่มว่างบนฐานข้อมูลเดิม -> คำนวณย้อนหลังจาก audit_logs ครั้งเดียว (INSERT ... SELECT GROUP BY)
+    from models import SearchDailyStat
+    from search_stats import rebuild_search_stats
+    try:
+        SearchDailyStat.__table__.create(engine, checkfirst=True)
+    except DBAPIError:
+        if not inspect(engine).has_table(SearchDailyStat.__tablename__):
+            raise
+    with engine.begin() as conn:
+        n = rebuild_search_stats(conn=conn)
+    log.info("search_daily_stats backfilled: %d rows", n)
+
+
+MIGRATIONS = [
+    (1, "create tables", _m1_create_tables),
+    (2, "vehicles: color, vin, recorded_date", _m2_vehicle_details),
+    (3, "line_users/line_groups: display_name", _m3_line_display_names),
+    (4, "audit_logs: actor/context display names", _m4_audit_display_names),
+    (5, "vehicles: plate_key, dedupe_key + indexes", _m5_vehicle_search_keys),
+    (6, "audit_logs: (when, id) composite indexes", _m6_audit_keyset_indexes),
+    (7, "drop single-column indexes superseded by composites", _m7_drop_superseded_indexes),
+    (8, "search_daily_stats: backfill from audit_logs", _m8_backfill_search_stats),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine) -> int:
+    """เวอร์ชัน schema ที่บันทึกไว้ (0 = ยังไม่เคย migrate / ไม่มีตาราง schema_version)"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+    except Exception:
+        return 0
+
+
+def upgrade(engine, target: int | None = None) -> list[int]:
+    """รัน migration ที่ยังไม่ได้รันจนถึง target (ค่าเริ่มต้น = ล่าสุด) คืนรายการเวอร์ชันที่รัน"""
+    target = LATEST_VERSION if target is None else target
+    with _migration_lock(engine):
+        try:
+            SchemaVersion.__table__.create(engine, checkfirst=True)
+        except DBAPIError:
+            if not inspect(engine).has_table(SchemaVersion.__tablename__):
+                raise
+        return _upgrade_locked(engine, target)
+
+
+def _upgrade_locked(engine, target: int) -> list[int]:
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target or version <= current_version(engine):
+            continue
+        log.info("schema migration %d: %s", version, description)
+        step(engine)
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(SchemaVersion), {
+                    "version": version, "description": description, "applied_at": datetime.utcnow(),
+                })
+        except Exception:
+            # worker อื่นรันเวอร์ชันเดียวกันเสร็จพร้อมกัน (primary key ซ้ำ) — ถือว่าสำเร็จ
+            if current_version(engine) < version:
+                raise
+        applied.append(version)
+    return applied
+
+
+def check_schema(app) -> int:
+    """
+    ตอนบูตอ่านเลขเวอร์ชันอย่างเดียว (query เดียว ไม่ reflect ตาราง)
+    ถ้า schema เก่ากว่าโค้ด: SCHEMA_AUTO_MIGRATE=1 จะ migrate ให้ ไม่งั้นแค่เตือนใน log
+    """
+    with app.app_context():
+        engine = db.engine
+        version = current_version(engine)
+        if version >= LATEST_VERSION:
+            return version
+        if app.config.get("SCHEMA_AUTO_MIGRATE", True):
+            try:
+                upgrade(engine)
+            except Exception:
+                # ไม่ให้ worker บูตล้ม (gunicorn จะหยุดทั้งเซิร์ฟเวอร์) — ขั้นที่ค้างจะลองใหม่รอบบูตถัดไป
+                app.logger.exception("schema auto-migration failed; run `flask --app app migrate`")
+            return current_version(engine)
+        app.logger.warning("database schema is at version %d, code expects %d — run `flask --app app migrate`",
+                           version, LATEST_VERSION)
+        return version
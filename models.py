@@ -1,7 +1,6 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
-from sqlalchemy import inspect
 
 
 db = SQLAlchemy()
@@ -10,6 +9,7 @@ class Vehicle(db.Model):
     __tablename__ = "vehicles"
     id = db.Column(db.Integer, primary_key=True)
     license_plate = db.Column(db.String(64), nullable=False, index=True)
+    plate_key = db.Column(db.String(64))  # ทะเบียนแบบ normalize สำหรับค้นหา (ดู plate_search.normalize_plate)
     brand = db.Column(db.String(64))
     model = db.Column(db.String(64))
     owner_name = db.Column(db.String(128))
@@ -17,9 +17,47 @@ class Vehicle(db.Model):
     color = db.Column(db.String(64))            # สีรถ
     vin = db.Column(db.String(64))              # เลขตัวถัง
     recorded_date = db.Column(db.Date)          # วันที่บันทึกข้อมูลในระบบ (YYYY-MM-DD)
+    dedupe_key = db.Column(db.String(160))      # คีย์ upsert (plate_key หรือ plate_key|VIN); NULL = แถวแบบเพิ่มต่อท้าย
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # ค้นหาทะเบียน (exact/prefix) + กรองอายุข้อมูลใน index เดียว
+        db.Index("ix_vehicles_plate_key_recorded", "plate_key", "recorded_date"),
+        db.Index("ux_vehicles_dedupe_key", "dedupe_key", unique=True),
+    )
+
+@db.event.listens_for(Vehicle, "before_insert")
+@db.event.listens_for(Vehicle, "before_update")
+def _vehicle_set_plate_key(mapper, connection, target):
+    # อัปเดตคีย์ค้นหาทุกครั้งที่เพิ่ม/แก้ไขผ่าน ORM (ฟอร์มเพิ่ม/แก้ไข)
+    from plate_search import normalize_plate
+    target.plate_key = normalize_plate(target.license_plate) or None
+    _vehicle_sync_dedupe_key(connection, target)
+
+def _vehicle_sync_dedupe_key(connection, target):
+    # คงคีย์ upsert ให้ตรงกับทะเบียน/เลขตัวถังปัจจุบัน เพื่อให้อัปโหลดแบบ upsert ครั้งถัดไปเจอแถวที่เพิ่ม/แก้ผ่านฟอร์ม
+    from vehicle_import import make_dedupe_key
+    t = Vehicle.__table__
+    if target.dedupe_key:
+        with_vin = "|" in target.dedupe_key  # คงรูปแบบคีย์เดิม (ทะเบียน หรือ ทะเบียน|เลขตัวถัง)
+    else:
+        # แถวที่ยังไม่มีคีย์: ใช้รูปแบบเดียวกับข้อมูลที่มีอยู่
+        sample = connection.execute(
+            db.select(t.c.dedupe_key).where(t.c.dedupe_key.isnot(None)).limit(1)
+        ).scalar()
+        with_vin = bool(sample and "|" in sample)
+    key = make_dedupe_key(target.plate_key, target.vin, with_vin)
+    if key == target.dedupe_key:
+        return
+    if key is not None:
+        q = db.select(t.c.id).where(t.c.dedupe_key == key)
+        if target.id is not None:
+            q = q.where(t.c.id != target.id)
+        if connection.execute(q.limit(1)).first() is not None:
+            key = None  # คีย์เป็นของแถวอื่นอยู่แล้ว -> แถวนี้เป็นแถวแบบเพิ่มต่อท้าย
+    target.dedupe_key = key
+
 class LineUser(db.Model):
     __tablename__ = "line_users"
     id = db.Column(db.Integer, primary_key=True)
@@ -50,11 +88,11 @@ class Admin(db.Model):
 class AuditLog(db.Model):
     __tablename__ = "audit_logs"
     id = db.Column(db.Integer, primary_key=True)
-    when = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # เวลา (UTC)
+    when = db.Column(db.DateTime, default=datetime.utcnow)  # เวลา (UTC)
 
     source_type = db.Column(db.String(10))         # 'user' | 'group' | 'room'
-    line_user_id = db.Column(db.String(64), index=True)
-    line_group_id = db.Column(db.String(64), index=True)
+    line_user_id = db.Column(db.String(64))
+    line_group_id = db.Column(db.String(64))
 
     query_text = db.Column(db.String(255), index=True)
     matched = db.Column(db.Integer)                # จำนวนผลลัพธ์ที่แสดง
@@ -64,43 +102,31 @@ class AuditLog(db.Model):
     actor_display_name = db.Column(db.String(120))    # ชื่อสมาชิกผู้พิมพ์ (จาก LINE)
     context_display_name = db.Column(db.String(120))  # ชื่อที่ตั้งค่า (จากตาราง line_users / line_groups)
 
-def ensure_auditlog_columns():
-    """
-    เพิ่มคอลัมน์ใหม่ให้ audit_logs ถ้ายังไม่มี:
-      - actor_display_name
-      - context_display_name
-    ทำงานเพียงครั้งเดียวต่อโปรเซส
-    """
-    global _AUDITLOG_CHECKED
-    if _AUDITLOG_CHECKED:
-        return
-
-    engine = db.engine
-    insp = inspect(engine)
-
-    # ถ้ายังไม่มีตาราง audit_logs ให้ปล่อยให้ db.create_all() จัดการ
-    if "audit_logs" not in insp.get_table_names():
-        _AUDITLOG_CHECKED = True
-        return
-
-    existing_cols = {c["name"] for c in insp.get_columns("audit_logs")}
-    to_add = []
-    if "actor_display_name" not in existing_cols:
-        to_add.append(("actor_display_name", "TEXT" if engine.dialect.name == "sqlite" else "VARCHAR(120)"))
-    if "context_display_name" not in existing_cols:
-        to_add.append(("context_display_name", "TEXT" if engine.dialect.name == "sqlite" else "VARCHAR(120)"))
-
-    if not to_add:
-        _AUDITLOG_CHECKED = True
-        return
-
-    try:
-        with engine.begin() as conn:
-            for col, typ in to_add:
-                conn.exec_driver_sql(f"ALTER TABLE audit_logs ADD COLUMN {col} {typ};")
-    except Exception as e:
-        # ไม่ให้ระบบล่ม: log ไว้แล้วไปต่อ
-        import logging
-        logging.exception("ALTER TABLE audit_logs failed: %s", e)
-    finally:
-        _AUDITLOG_CHECKED = True
+    __table_args__ = (
+        # ทุกตัวกรองของหน้า /admin/logs เรียงตาม (when, id) เพื่อแบ่งหน้าแบบ keyset ผ่าน index
+        db.Index("ix_audit_logs_when_id", "when", "id"),
+        db.Index("ix_audit_logs_user_when", "line_user_id", "when", "id"),
+        db.Index("ix_audit_logs_group_when", "line_group_id", "when", "id"),
+        db.Index("ix_audit_logs_allowed_when", "allowed", "when", "id"),
+    )
+
+class SearchDailyStat(db.Model):
+    """สรุปจำนวนการค้นหารายวัน (เวลาไทย) อัปเดตทีละน้อยทุกครั้งที่เขียน audit_logs"""
+    __tablename__ = "search_daily_stats"
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)                       # วันที่ (Asia/Bangkok)
+    source_type = db.Column(db.String(10), nullable=False, default="")  # 'user' | 'group' | 'room' | ''
+    allowed = db.Column(db.Boolean, nullable=False)
+    matched = db.Column(db.Boolean, nullable=False)                # พบผลลัพธ์อย่างน้อย 1 รายการ
+    searches = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ux_search_daily_stats_key", "day", "source_type", "allowed", "matched", unique=True),
+    )
+
+class SchemaVersion(db.Model):
+    """เวอร์ชัน schema ที่ migrate แล้ว (หนึ่งแถวต่อหนึ่งขั้น ดู migrations.py)"""
+    __tablename__ = "schema_version"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
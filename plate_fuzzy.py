@@ -0,0 +1,389 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import current_app
+
+from cache import VersionStamp
+
+log = logging.getLogger(__name__)
+
+# กลุ่มอักขระที่พิมพ์/อ่านสับสนบ่อย (หน้าตาหรือเสียงคล้ายกัน) — แทนกันในกลุ่มเดียวกันคิดต้นทุนต่ำ
+CONFUSABLE_GROUPS = (
+    "ขฃ", "คฅฆ", "ดตฎฏ", "บป", "ผฝ", "พฟ", "ถภ", "ชซ", "ทธฑ", "ศษส", "ณน", "ญย", "ลฬ", "หฮ",
+    "0o", "1li",
+)
+CONFUSABLE_COST = 0.3
+
+# อักขระ -> ตัวแทนของกลุ่ม (ตัวแรก)
+_FOLD = str.maketrans({c: g[0] for g in CONFUSABLE_GROUPS for c in g[1:]})
+
+
+def fold_plate(key: str) -> str:
+    """แทนอักขระที่สับสนได้ด้วยตัวแทนกลุ่ม (ใช้กับคีย์ที่ normalize แล้ว)"""
+    return key.translate(_FOLD)
+
+
+def _sub_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    return CONFUSABLE_COST if a.translate(_FOLD) == b.translate(_FOLD) else 1.0
+
+
+def plate_distance(a: str, b: str) -> float:
+    """
+    edit distance แบบถ่วงน้ำหนัก (เพิ่ม/ลบ/แทน/สลับตัวติดกัน = 1, แทนด้วยตัวที่สับสนได้ = CONFUSABLE_COST)
+    ใช้จัดอันดับผลลัพธ์ที่ผ่านตัวกรองแล้วเท่านั้น (ทะเบียนสั้น ตาราง DP เล็ก)
+    """
+    prev2 = None
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + _sub_cost(a[i - 1], b[j - 1]))
+            if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, prev2[j - 2] + 1)
+            cur[j] = d
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _within_one(a: str, b: str) -> bool:
+    """a กับ b ต่างกันไม่เกิน 1 การแก้ (เพิ่ม/ลบ/แทน/สลับตัวติดกัน) — O(n) ไม่ใช้ DP"""
+    if len(a) > len(b):
+        a, b = b, a
+    la, lb = len(a), len(b)
+    if lb - la > 1:
+        return False
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if i >= la - 1:
+            return True
+        return a[i + 1:] == b[i + 1:] or (a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:])
+    return a[i:] == b[i + 1:]
+
+
+class PlateIndex:
+    """
+    ดัชนีทะเบียนในหน่วยความจำสำหรับค้นแบบทนพิมพ์ผิด (ระยะ 1 การแก้ หลัง fold อักขระที่สับสนได้)
+    หลัก pigeonhole: แบ่งคีย์ยาว m เป็นครึ่งหน้า/ครึ่งหลัง ถ้าแก้ได้ 1 ครั้ง อย่างน้อยครึ่งหนึ่งต้องตรงเป๊ะ
+    จึงเก็บแต่ละคีย์ไว้ 2 bucket: (m, ครึ่งหน้า) และ (m, ครึ่งหลัง) แล้วค้นเฉพาะ bucket ของความยาว m-1..m+1
+    ครึ่งหน้าสั้นกว่า (m // 2) เพราะส่วนหน้าของทะเบียนเป็นพยัญชนะ แยกแยะได้ดีกว่าตัวเลขท้าย
+    อ่านได้พร้อมกันหลาย thread โดยไม่ล็อก; add/remove ล็อกเฉพาะตอนแก้
+    """
+
+    def __init__(self):
+        self._pre: dict[str, list[str]] = {}
+        self._suf: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+
+    @staticmethod
+    def _bucket_keys(folded: str) -> tuple[str, str]:
+        tag = chr(len(folded))
+        half = len(folded) // 2
+        return tag + folded[:half], tag + folded[half:]
+
+    @classmethod
+    def from_keys(cls, keys) -> "PlateIndex":
+        """สร้างจากคีย์ที่ไม่ซ้ำกัน (ไม่ล็อก ไม่ตรวจซ้ำ — เร็วกว่า add ทีละตัว)"""
+        index = cls()
+        pre, suf, bucket_keys = index._pre, index._suf, cls._bucket_keys
+        n = 0
+        for key in keys:
+            if key:
+                p, s = bucket_keys(key.translate(_FOLD))
+                pre.setdefault(p, []).append(key)
+                suf.setdefault(s, []).append(key)
+                n += 1
+        index.size = n
+        return index
+
+    def add(self, key: str, check: bool = True):
+        if not key:
+            return
+        pre, suf = self._bucket_keys(fold_plate(key))
+        with self._lock:
+            bucket = self._pre.setdefault(pre, [])
+            if check and key in bucket:
+                return
+            bucket.append(key)
+            self._suf.setdefault(suf, []).append(key)
+            self.size += 1
+
+    def remove(self, key: str):
+        if not key:
+            return
+        pre, suf = self._bucket_keys(fold_plate(key))
+        with self._lock:
+            for table, bk in ((self._pre, pre), (self._suf, suf)):
+                bucket = table.get(bk)
+                if bucket and key in bucket:
+                    bucket.remove(key)
+                    if not bucket:
+                        del table[bk]
+                    if table is self._pre:
+                        self.size -= 1
+
+    def lookup(self, key: str, limit: int = 20) -> list[str]:
+        """คีย์ทะเบียนที่ห่างจาก key ไม่เกิน 1 การแก้ (หลัง fold) เรียงจากใกล้สุดตาม plate_distance"""
+        fq = fold_plate(key)
+        n = len(fq)
+        seen = set()
+        found = []
+        for m in (n - 1, n, n + 1):
+            if m < 2:
+                continue
+            tag = chr(m)
+            half = m // 2
+            tail = m - half
+            buckets = [self._pre.get(tag + fq[:half]), self._suf.get(tag + fq[n - tail:]) if tail <= n else None]
+            if m == n and half:
+                # สลับตัวติดกันตรงรอยต่อสองครึ่ง ทำให้ทั้งสองครึ่งไม่ตรง: ลองสลับกลับแล้วค้นครึ่งหน้า
+                buckets.append(self._pre.get(tag + fq[:half - 1] + fq[half]))
+            for bucket in buckets:
+                for cand in bucket or ():
+                    if cand not in seen:
+                        seen.add(cand)
+                        if _within_one(fold_plate(cand), fq):
+                            found.append(cand)
+        found.sort(key=lambda c: (plate_distance(key, c), c))
+        return found[:limit]
+
+    def stats(self) -> dict:
+        return {"keys": self.size, "prefix_buckets": len(self._pre), "suffix_buckets": len(self._suf)}
+
+
+class PlateJournal:
+    """
+    บันทึกการเปลี่ยนคีย์ทะเบียน (add/remove/rebuild) ในไฟล์ SQLite บนเครื่อง ให้ทุก gunicorn worker
+    นำไปแก้ดัชนีของตัวเองต่อได้ (แบบเดียวกับ SnapshotStore) เก็บเฉพาะ keep แถวล่าสุด
+    """
+
+    def __init__(self, path: str, keep: int = 10000):
+        self.path = path
+        self.keep = keep
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS plate_changes "
+                        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT, key TEXT)"
+                    )
+                    self._ready = True
+        return conn
+
+    def append(self, changes: list[tuple[str, str | None]]):
+        conn = self._connect()
+        try:
+            conn.executemany("INSERT INTO plate_changes (op, key) VALUES (?, ?)", changes)
+            conn.execute(
+                "DELETE FROM plate_changes WHERE seq <= (SELECT MAX(seq) FROM plate_changes) - ?", (self.keep,)
+            )
+        finally:
+            conn.close()
+
+    def last_seq(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM plate_changes").fetchone()[0]
+        finally:
+            conn.close()
+
+    def since(self, seq: int) -> tuple[int | None, list]:
+        """(seq ต่ำสุดที่ยังเก็บอยู่, รายการหลัง seq)"""
+        conn = self._connect()
+        try:
+            first = conn.execute("SELECT MIN(seq) FROM plate_changes").fetchone()[0]
+            rows = conn.execute(
+                "SELECT seq, op, key FROM plate_changes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+            return first, rows
+        finally:
+            conn.close()
+
+
+# ---------- ดัชนีของโปรเซสนี้ (สร้างใน thread เบื้องหลังครั้งแรกที่ใช้) ----------
+
+_index: PlateIndex | None = None
+_journal: PlateJournal | None = None
+_stamp: VersionStamp | None = None
+_applied_seq = 0
+_building = False
+_resync = False  # สร้างดัชนีเสร็จแล้ว: อ่าน journal ต่ออีกรอบโดยไม่ต้องรอ stamp
+_state_lock = threading.Lock()
+_stats = {"lookups": 0, "builds": 0, "build_seconds": None, "journal_errors": 0}
+
+# เปลี่ยนเกินจำนวนนี้ในครั้งเดียว (เช่น นำเข้า CSV) ให้ทุก worker สร้างดัชนีใหม่แทนการส่งทีละคีย์
+_REBUILD_THRESHOLD = 5000
+
+
+def _enabled() -> bool:
+    return bool(current_app.config.get("PLATE_FUZZY_ENABLED", True))
+
+
+def _get_journal() -> PlateJournal:
+    global _journal, _stamp
+    if _journal is None:
+        with _state_lock:
+            if _journal is None:
+                path = current_app.config.get("PLATE_FUZZY_JOURNAL") or os.path.join(
+                    tempfile.gettempdir(), "spf_plate_journal.sqlite"
+                )
+                _stamp = VersionStamp(path + ".stamp")
+                _journal = PlateJournal(path)
+    return _journal
+
+
+def _build(app):
+    global _index, _applied_seq, _building, _resync
+    from sqlalchemy import select
+    from models import Vehicle, db
+
+    t0 = time.perf_counter()
+    try:
+        with app.app_context():
+            try:
+                seq = _get_journal().last_seq()
+            except sqlite3.Error:
+                seq = 0
+            stmt = select(Vehicle.plate_key).where(Vehicle.plate_key.is_not(None)).distinct()
+            index = PlateIndex.from_keys(db.session.scalars(stmt.execution_options(yield_per=50000)))
+            db.session.remove()
+        # การเปลี่ยนที่เกิดระหว่างสร้างจะถูกนำมาใช้ซ้ำจาก journal (add/remove ซ้ำได้ไม่มีผลเสีย)
+        with _state_lock:
+            _index, _applied_seq, _resync = index, seq, True
+        _stats["builds"] += 1
+        _stats["build_seconds"] = round(time.perf_counter() - t0, 3)
+        log.info("plate fuzzy index built: %d keys in %.2fs", index.size, _stats["build_seconds"])
+    except Exception:
+        log.exception("plate fuzzy index build failed")
+    finally:
+        _building = False
+
+
+def _start_build():
+    global _building
+    with _state_lock:
+        if _building:
+            return
+        _building = True
+    threading.Thread(target=_build, args=(current_app._get_current_object(),),
+                     name="plate-fuzzy-build", daemon=True).start()
+
+
+def build_plate_index():
+    """สร้างดัชนีใหม่ทันทีใน thread นี้ (สำหรับสคริปต์/benchmark; ในเว็บสร้างเบื้องหลังเอง)"""
+    global _building
+    with _state_lock:
+        _building = True
+    _build(current_app._get_current_object())
+
+
+def _sync():
+    """นำการเปลี่ยนจาก worker อื่นมาใช้ (อ่าน journal เฉพาะเมื่อ stamp เปลี่ยน)"""
+    global _applied_seq, _resync
+    journal = _get_journal()
+    if not _stamp.changed() and not _resync:
+        return
+    _resync = False
+    try:
+        first, rows = journal.since(_applied_seq)
+    except sqlite3.Error:
+        _stats["journal_errors"] += 1
+        return
+    if first is not None and first > _applied_seq + 1:
+        _start_build()  # journal ถูกตัดทิ้งเกินจุดที่เราอ่านถึง
+        return
+    index = _index
+    for seq, op, key in rows:
+        if op == "rebuild":
+            _start_build()
+            return
+        if op == "add":
+            index.add(key)
+        elif op == "remove":
+            index.remove(key)
+        _applied_seq = seq
+
+
+def fuzzy_plate_keys(key: str, limit: int | None = None) -> list[str]:
+    """
+    คีย์ทะเบียน (plate_key) ที่ใกล้เคียง key สำหรับใช้เมื่อค้นแบบปกติไม่พบ
+    คืน [] ถ้าปิดใช้งาน คำค้นสั้นเกินไป หรือดัชนียังสร้างไม่เสร็จ (ไม่รอ)
+    """
+    if not key or not _enabled():
+        return []
+    cfg = current_app.config
+    if len(key) < cfg.get("PLATE_FUZZY_MIN_LEN", 4):
+        return []
+    if _index is None:
+        _start_build()
+        return []
+    _sync()
+    _stats["lookups"] += 1
+    return _index.lookup(key, limit or cfg.get("PLATE_FUZZY_MAX_KEYS", 20))
+
+
+def plate_keys_changed(removed=(), added=()):
+    """
+    เรียกหลัง commit การเพิ่ม/แก้/ลบรถ: แก้ดัชนีของโปรเซสนี้ทันที และบันทึกลง journal ให้ worker อื่น
+    คีย์ใน removed ที่ยังมีรถคันอื่นใช้อยู่จะไม่ถูกลบออกจากดัชนี
+    """
+    if not _enabled():
+        return
+    from sqlalchemy import select
+    from models import Vehicle, db
+
+    removed = {k for k in removed if k} - {k for k in added if k}
+    added = {k for k in added if k}
+    if removed:
+        still = set(db.session.scalars(select(Vehicle.plate_key).where(Vehicle.plate_key.in_(removed)).distinct()))
+        removed -= still
+    if not removed and not added:
+        return
+    if len(removed) + len(added) > _REBUILD_THRESHOLD:
+        plate_index_reload()
+        return
+    if _index is not None:
+        for k in removed:
+            _index.remove(k)
+        for k in added:
+            _index.add(k)
+    try:
+        _get_journal().append([("remove", k) for k in removed] + [("add", k) for k in added])
+        _stamp.bump()
+    except sqlite3.Error:
+        _stats["journal_errors"] += 1
+        log.exception("plate journal error")
+
+
+def plate_index_reload():
+    """ให้ทุก worker สร้างดัชนีใหม่จากฐานข้อมูล (หลังนำเข้า CSV / backfill plate_key)"""
+    if not _enabled():
+        return
+    try:
+        _get_journal().append([("rebuild", None)])
+        _stamp.bump()
+    except sqlite3.Error:
+        _stats["journal_errors"] += 1
+        log.exception("plate journal error")
+    if _index is not None:
+        _start_build()
+
+
+def plate_fuzzy_stats() -> dict:
+    if _index is None:
+        return {"ready": False, "building": _building, **_stats}
+    return {"ready": True, "building": _building, "applied_seq": _applied_seq, **_index.stats(), **_stats}
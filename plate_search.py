@@ -0,0 +1,165 @@
+import re
+from datetime import date
+from sqlalchemy import and_, or_, literal, select, union_all
+from sqlalchemy.orm import aliased
+
+from dbutil import escape_like
+
+# ตัวเลขไทย / อารบิก-อินดิก -> ตัวเลขอารบิก (0-9)
+_DIGITS = {}
+for _base in (0x0E50, 0x0660, 0x06F0):  # ๐-๙, ٠-٩, ۰-۹
+    for _i in range(10):
+        _DIGITS[_base + _i] = str(_i)
+
+_STRIP_RE = re.compile(r"[\s\-_.·/]+")
+
+# ใช้เป็นขอบบนของช่วง prefix (ค่าอักขระสูงสุดของ Unicode)
+_KEY_UPPER = "\U0010FFFF"
+
+
+def normalize_plate(text: str | None) -> str:
+    """
+    แปลงทะเบียนให้เป็นคีย์สำหรับค้นหา:
+      - ตัดช่องว่าง ขีด จุด ออก
+      - ตัวพิมพ์เล็กทั้งหมด
+      - ตัวเลขไทย/อารบิก-อินดิก -> 0-9
+    เช่น "1กก-1234", "๑กก ๑๒๓๔" -> "1กก1234"
+    """
+    if not text:
+        return ""
+    return _STRIP_RE.sub("", text.translate(_DIGITS)).casefold()
+
+
+def indexed_plate_filter(key: str):
+    # exact + prefix ในรูปช่วง (>= key AND < key + max) เพื่อให้ใช้ index ได้ทุก dialect
+    from models import Vehicle
+    return and_(Vehicle.plate_key >= key, Vehicle.plate_key < key + _KEY_UPPER)
+
+
+def substring_plate_filter(key: str, raw_text: str):
+    # fallback: สแกนแบบ substring (ใช้ index ไม่ได้)
+    # แถวเก่าที่ยังไม่ backfill (plate_key ว่าง) ใช้ ilike กับทะเบียนเดิม
+    from models import Vehicle
+    return or_(
+        Vehicle.plate_key.like(f"%{escape_like(key)}%", escape="\\"),
+        and_(Vehicle.plate_key.is_(None), Vehicle.license_plate.ilike(f"%{escape_like(raw_text)}%", escape="\\")),
+    )
+
+
+def plate_search_condition(text: str):
+    """
+    เงื่อนไข WHERE สำหรับค้นหาทะเบียน (ใช้กับ query ที่แบ่งหน้าเอง)
+    ใช้ exact/prefix ถ้ามีผลอย่างน้อย 1 แถว ไม่เช่นนั้นใช้ substring; คืน None ถ้าข้อความว่าง
+    ข้อความที่ normalize แล้วว่าง (เช่น "-" หรือ ".") ค้นแบบ ilike กับทะเบียนเดิมแทน ไม่คืนทั้งตาราง
+    """
+    from models import Vehicle, db
+    raw = (text or "").strip()
+    if not raw:
+        return None
+    key = normalize_plate(raw)
+    if not key:
+        return Vehicle.license_plate.ilike(f"%{escape_like(raw)}%", escape="\\")
+    cond = indexed_plate_filter(key)
+    if db.session.query(Vehicle.id).filter(cond).limit(1).first() is not None:
+        return cond
+    return substring_plate_filter(key, raw)
+
+
+def fuzzy_plate_filter(key: str):
+    """
+    เงื่อนไขสำหรับทะเบียนที่ใกล้เคียง key (พิมพ์ผิด 1 ตัว / อักขระที่สับสนได้) จากดัชนีในหน่วยความจำ
+    คืน (เงื่อนไข, ลำดับคีย์จากใกล้สุด) หรือ (None, {}) ถ้าไม่มีผู้สมัคร
+    """
+    from models import Vehicle
+    from plate_fuzzy import fuzzy_plate_keys
+    keys = fuzzy_plate_keys(key)
+    if not keys:
+        return None, {}
+    return Vehicle.plate_key.in_(keys), {k: i for i, k in enumerate(keys)}
+
+
+def rank_fuzzy(rows: list, rank: dict) -> list:
+    # ใกล้สุดก่อน แล้วใหม่สุดก่อน
+    return sorted(rows, key=lambda v: (rank.get(v.plate_key, len(rank)), -v.id))
+
+
+def search_vehicles(text: str, limit: int = 20, min_recorded_date: date | None = None) -> tuple[list, bool]:
+    """
+    ค้นหารถจากทะเบียน: ลองแบบ exact/prefix ผ่าน index ก่อน
+    ถ้าไม่พบจึงค่อย fallback เป็น substring scan และสุดท้ายทะเบียนที่ใกล้เคียง (พิมพ์ผิด)
+    min_recorded_date: กรองเฉพาะข้อมูลที่ recorded_date >= ค่านี้ (ทำใน SQL, ใช้ index ร่วมกับ plate_key)
+    คืน (รายการรถ, fuzzy) โดย fuzzy=True เมื่อผลมาจากทะเบียนใกล้เคียง ไม่ใช่ทะเบียนที่ตรงกัน
+    """
+    from models import Vehicle
+    key = normalize_plate(text)
+    if not key:
+        return [], False
+
+    def run(cond):
+        q = Vehicle.query.filter(cond)
+        if min_recorded_date is not None:
+            q = q.filter(Vehicle.recorded_date >= min_recorded_date)
+        return q.order_by(Vehicle.id.desc()).limit(limit).all()
+
+    rows = run(indexed_plate_filter(key))
+    if rows:
+        return rows, False
+    rows = run(substring_plate_filter(key, text.strip()))
+    if rows:
+        return rows, False
+    cond, rank = fuzzy_plate_filter(key)
+    if cond is None:
+        return [], False
+    rows = rank_fuzzy(run(cond), rank)
+    return rows, bool(rows)
+
+
+def search_vehicles_many(texts, limit: int = 20,
+                         min_recorded_date: date | None = None) -> tuple[dict[str, list], set[str]]:
+    """
+    ค้นหาหลายทะเบียนพร้อมกัน (เช่น หลาย event ใน webhook เดียว)
+    คืน ({คีย์ normalize: รายการรถ}, เซตคีย์ที่ผลมาจากทะเบียนใกล้เคียง)
+    ใช้ UNION ALL ของการค้นแบบ exact/prefix ทุกคีย์ใน query เดียว (แต่ละส่วนยังใช้ index + LIMIT ของตัวเอง)
+    คีย์ที่ไม่พบจึงรวมกันไปทำ substring scan อีก query เดียว และทะเบียนใกล้เคียงอีก query เดียว
+    -> รวมไม่เกิน 3 round-trip ไม่ว่าจะกี่คำค้น
+    """
+    from models import Vehicle, db
+    raw = {}
+    for text in texts:
+        key = normalize_plate(text)
+        if key:
+            raw.setdefault(key, text.strip())
+    keys = list(raw)
+    results: dict[str, list] = {k: [] for k in keys}
+
+    def run(conds):
+        branches = []
+        for i, cond in conds:
+            q = select(Vehicle, literal(i).label("qi")).where(cond)
+            if min_recorded_date is not None:
+                q = q.where(Vehicle.recorded_date >= min_recorded_date)
+            # ห่อเป็น subquery: SQLite ไม่ยอมให้ ORDER BY/LIMIT อยู่ในแต่ละส่วนของ UNION โดยตรง
+            branches.append(select(q.order_by(Vehicle.id.desc()).limit(limit).subquery()))
+        u = union_all(*branches).subquery()
+        for v, qi in db.session.execute(select(aliased(Vehicle, u), u.c.qi)):
+            results[keys[qi]].append(v)
+
+    if keys:
+        run([(i, indexed_plate_filter(k)) for i, k in enumerate(keys)])
+        misses = [(i, substring_plate_filter(k, raw[k])) for i, k in enumerate(keys) if not results[k]]
+        if misses:
+            run(misses)
+    for rows in results.values():
+        rows.sort(key=lambda v: v.id, reverse=True)
+
+    fuzzy = []
+    for i, k in enumerate(keys):
+        if not results[k]:
+            cond, rank = fuzzy_plate_filter(k)
+            if cond is not None:
+                fuzzy.append((i, cond, rank))
+    if fuzzy:
+        run([(i, cond) for i, cond, _ in fuzzy])
+        for i, _, rank in fuzzy:
+            results[keys[i]] = rank_fuzzy(results[keys[i]], rank)
+    return results, {keys[i] for i, _, _ in fuzzy if results[keys[i]]}
@@ -0,0 +1,88 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select, delete, insert, func, case, literal
+
+from models import db, AuditLog, SearchDailyStat
+from dbutil import upsert_stmt, bkk_day, BKK_UTC_OFFSET_HOURS
+
+
+def _stat_key(row: dict) -> tuple:
+    day = (row["when"] + timedelta(hours=BKK_UTC_OFFSET_HOURS)).date()
+    return (
+        day,
+        row.get("source_type") or "",
+        row.get("allowed") is not False,
+        bool(row.get("matched")),
+    )
+
+
+def bump_search_stats(rows: list[dict]):
+    """
+    บวกจำนวนการค้นหาเข้า search_daily_stats จากแถว audit ที่เพิ่งเขียน
+    (ใช้ session/transaction เดียวกับผู้เรียก — ผู้เรียก commit เอง)
+    """
+    counts = Counter(_stat_key(r) for r in rows)
+    if not counts:
+        return
+    t = SearchDailyStat.__table__
+    values = [
+        {"day": d, "source_type": st, "allowed": al, "matched": m, "searches": n}
+        # เรียงคีย์เสมอ ลดโอกาส deadlock เมื่อหลาย worker เขียนพร้อมกัน
+        for (d, st, al, m), n in sorted(counts.items())
+    ]
+    stmt = upsert_stmt(
+        t, ["day", "source_type", "allowed", "matched"],
+        lambda new: {"searches": t.c.searches + new.searches},
+    )
+    db.session.execute(stmt, values)
+
+
+def rebuild_search_stats(since: date | None = None, until: date | None = None, conn=None) -> int:
+    """
+    คำนวณ search_daily_stats ใหม่จาก audit_logs ในช่วงวัน [since, until] (เวลาไทย)
+    ค่าเริ่มต้น since = วันแรกที่ยังมีแถวใน audit_logs (สรุปของวันที่ archive ไปแล้วจะไม่ถูกล้าง)
+    conn: connection ของผู้เรียก (เช่น migration) — ผู้เรียก commit เอง; ไม่ระบุ = ใช้ db.session แล้ว commit
+    คืนจำนวนแถวสรุปที่สร้าง
+    """
+    ex = conn if conn is not None else db.session
+    day_col = bkk_day(AuditLog.when, conn.dialect.name if conn is not None else None)
+    if since is None:
+        first = ex.execute(select(func.min(AuditLog.when))).scalar()
+        if first is None:
+            return 0
+        since = (first + timedelta(hours=BKK_UTC_OFFSET_HOURS)).date()
+
+    conds = [SearchDailyStat.day >= since]
+    if until is not None:
+        conds.append(SearchDailyStat.day <= until)
+    ex.execute(delete(SearchDailyStat).where(*conds))
+
+    start_utc = datetime.combine(since, time.min) - timedelta(hours=BKK_UTC_OFFSET_HOURS)
+    source_col = func.coalesce(AuditLog.source_type, literal(""))
+    allowed_col = func.coalesce(AuditLog.allowed, literal(True))
+    matched_col = case((AuditLog.matched > 0, literal(True)), else_=literal(False))
+    src = (
+        select(day_col, source_col, allowed_col, matched_col, func.count(AuditLog.id))
+        .where(AuditLog.when >= start_utc)
+        .group_by(day_col, source_col, allowed_col, matched_col)
+    )
+    if until is not None:
+        end_utc = datetime.combine(until + timedelta(days=1), time.min) - timedelta(hours=BKK_UTC_OFFSET_HOURS)
+        src = src.where(AuditLog.when < end_utc)
+    result = ex.execute(
+        insert(SearchDailyStat).from_select(["day", "source_type", "allowed", "matched", "searches"], src)
+    )
+    if conn is None:
+        db.session.commit()
+    return result.rowcount or 0
+
+
+def daily_search_counts(since: date, until: date) -> dict:
+    """{วันที่: จำนวนการค้นหา} จากตารางสรุป (ไม่แตะ audit_logs)"""
+    rows = db.session.execute(
+        select(SearchDailyStat.day, func.sum(SearchDailyStat.searches))
+        .where(SearchDailyStat.day >= since, SearchDailyStat.day <= until)
+        .group_by(SearchDailyStat.day)
+    ).all()
+    return {d: int(n or 0) for d, n in rows}
@@ -0,0 +1,101 @@
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# ตัดข้อความ SQL ใน log ให้สั้นพอ (IN (...) ยาว ๆ)
+MAX_STATEMENT_LOG = 500
+
+
+class RequestQueryStats:
+    __slots__ = ("count", "total", "slowest", "slowest_sql")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+
+
+def param_shape(parameters, executemany: bool = False) -> str:
+    """รูปแบบของ bound parameters (ชื่อ/ชนิด ไม่รวมค่า — ไม่ให้ข้อมูลเจ้าของรถหลุดลง log)"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = param_shape(parameters[0]) if parameters else "-"
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _current_stats() -> RequestQueryStats | None:
+    if not has_request_context():
+        return None  # thread เบื้องหลัง (audit writer, async webhook) ไม่นับรวมกับ request
+    return g.get("_sql_stats")
+
+
+def install_query_tracing(app, engine):
+    """
+    นับจำนวน query / เวลา DB รวม / query ที่ช้าที่สุด ต่อ request (ผ่าน engine events)
+    - query ที่ช้ากว่า SQL_SLOW_QUERY_MS ถูก log พร้อมรูปแบบ parameter
+    - ใส่ผลรวมใน header Server-Timing (ดูได้ใน DevTools ของเบราว์เซอร์)
+    """
+    slow_s = app.config.get("SQL_SLOW_QUERY_MS", 200) / 1000.0
+    many_queries = app.config.get("SQL_QUERY_COUNT_WARN", 20)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_sql_trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exc_context):
+        conn = exc_context.connection
+        if conn is not None and conn.info.get("_sql_trace_start"):
+            conn.info["_sql_trace_start"].pop()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_sql_trace_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats = _current_stats()
+        if stats is not None:
+            stats.count += 1
+            stats.total += elapsed
+            if elapsed > stats.slowest:
+                stats.slowest = elapsed
+                stats.slowest_sql = statement
+        if elapsed >= slow_s:
+            where = f"{request.method} {request.path}" if has_request_context() else "background"
+            log.warning("slow query %.1f ms (%s): %s -- params %s", elapsed * 1000, where,
+                        " ".join(statement.split())[:MAX_STATEMENT_LOG], param_shape(parameters, executemany))
+
+    @app.before_request
+    def _sql_trace_begin():
+        g._sql_stats = RequestQueryStats()
+        g._sql_trace_t0 = time.perf_counter()
+
+    @app.after_request
+    def _sql_trace_end(response):
+        stats = g.pop("_sql_stats", None)
+        t0 = g.pop("_sql_trace_t0", None)
+        if stats is None:
+            return response
+        parts = [
+            f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"',
+            f"db-slowest;dur={stats.slowest * 1000:.1f}",
+        ]
+        if t0 is not None:
+            parts.append(f"app;dur={(time.perf_counter() - t0) * 1000:.1f}")
+        response.headers.add("Server-Timing", ", ".join(parts))
+        # จำนวน query ต่อ request สูงผิดปกติ มักเป็น N+1
+        level = logging.WARNING if many_queries and stats.count > many_queries else logging.DEBUG
+        log.log(level, "%s %s: %d queries, %.1f ms in DB, slowest %.1f ms: %s", request.method, request.path,
+                  stats.count, stats.total * 1000, stats.slowest * 1000,
+                  " ".join((stats.slowest_sql or "").split())[:MAX_STATEMENT_LOG])
+        return response
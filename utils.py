@@ -1,7 +1,11 @@
-from flask import session, redirect, url_for, flash
+import os
+import tempfile
+import threading
+from flask import session, redirect, url_for, flash, current_app
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import LineUser, LineGroup
+from cache import TTLCache, VersionStamp
 
 def hash_password(plain: str) -> str:
     return generate_password_hash(plain)
@@ -18,16 +22,86 @@ def login_required(view):
         return view(*args, **kwargs)
     return wrapped
 
+_acl_cache = None
+_acl_stamp = None
+_acl_lock = threading.Lock()
+
+def _get_acl_cache() -> TTLCache:
+    global _acl_cache, _acl_stamp
+    if _acl_cache is None:
+        with _acl_lock:
+            if _acl_cache is None:
+                cfg = current_app.config
+                path = cfg.get("LINE_ACL_STAMP_FILE") or os.path.join(tempfile.gettempdir(), "spf_line_acl.stamp")
+                _acl_stamp = VersionStamp(path)
+                _acl_cache = TTLCache("line_acl", maxsize=cfg.get("LINE_ACL_CACHE_SIZE", 10000),
+                                      ttl=cfg.get("LINE_ACL_CACHE_TTL", 300),
+                                      negative_ttl=cfg.get("LINE_ACL_CACHE_NEG_TTL", 5))
+    # มี worker อื่นแก้สิทธิ์ -> ล้างแคชของโปรเซสนี้ทั้งหมด
+    if _acl_stamp.changed():
+        _acl_cache.clear()
+    return _acl_cache
+
+def _load_line_user(user_id: str) -> tuple:
+    u = LineUser.query.filter_by(line_user_id=user_id).first()
+    # (มีในระบบ, เปิดสิทธิ์, ชื่อที่ตั้งค่า)
+    return (True, bool(u.is_active), u.display_name or None) if u else (False, False, None)
+
+def _load_line_group(group_id: str) -> tuple:
+    g = LineGroup.query.filter_by(line_group_id=group_id).first()
+    return (True, bool(g.is_active), g.display_name or None) if g else (False, False, None)
+
+def get_line_user_info(user_id: str | None) -> tuple:
+    if not user_id:
+        return (False, False, None)
+    return _get_acl_cache().get_or_load(("user", user_id), lambda: _load_line_user(user_id)) or (False, False, None)
+
+def get_line_group_info(group_id: str | None) -> tuple:
+    if not group_id:
+        return (False, False, None)
+    return _get_acl_cache().get_or_load(("group", group_id), lambda: _load_line_group(group_id)) or (False, False, None)
+
+def prefetch_line_access(user_ids, group_ids):
+    """
+    เติมแคชสิทธิ์ของหลาย user/group ในครั้งเดียว (ใช้ตอน payload มีหลาย event)
+    เฉพาะ id ที่ยังไม่อยู่ในแคช: query แบบ IN (...) หนึ่งครั้งต่อชนิด รวม id ที่ไม่มีในระบบด้วย (ผลลบ)
+    """
+    cache = _get_acl_cache()
+    for kind, model, column, ids in (("user", LineUser, LineUser.line_user_id, user_ids),
+                                      ("group", LineGroup, LineGroup.line_group_id, group_ids)):
+        missing = [i for i in set(filter(None, ids)) if cache.get((kind, i)) is None]
+        if not missing:
+            continue
+        found = {getattr(r, column.key): r for r in model.query.filter(column.in_(missing))}
+        for i in missing:
+            r = found.get(i)
+            cache.set((kind, i), (True, bool(r.is_active), r.display_name or None) if r else (False, False, None))
+
+def resolve_line_access(source_type: str | None, user_id: str | None, group_id: str | None) -> tuple[bool, str | None]:
+    """
+    คืน (มีสิทธิ์หรือไม่, ชื่อที่ตั้งค่าของแหล่งที่มา) จากการค้นครั้งเดียวต่อ user/group (ผ่านแคช)
+    อนุญาตหาก (user_id ถูกเปิดสิทธิ์) หรือ (group_id ถูกเปิดสิทธิ์)
+    """
+    _, user_active, user_name = get_line_user_info(user_id)
+    _, group_active, group_name = get_line_group_info(group_id)
+    if source_type == "user":
+        context_name = user_name
+    elif source_type in ("group", "room"):
+        context_name = group_name
+    else:
+        context_name = None
+    return (user_active or group_active), context_name
+
 def has_line_permission(user_id: str | None, group_id: str | None) -> bool:
-    # อนุญาตหาก (user_id ถูกเปิดสิทธิ์) หรือ (group_id ถูกเปิดสิทธิ์)
-    from models import LineUser, LineGroup
-    allowed = False
+    return resolve_line_access(None, user_id, group_id)[0]
+
+def invalidate_line_user(user_id: str | None):
+    # เรียกหลังเพิ่ม/แก้/ลบ LineUser เพื่อให้สิทธิ์มีผลทันที (ทุก worker)
     if user_id:
-        u = LineUser.query.filter_by(line_user_id=user_id, is_active=True).first()
-        if u:
-            allowed = True
+        _get_acl_cache().delete(("user", user_id))
+        _acl_stamp.bump()
+
+def invalidate_line_group(group_id: str | None):
     if group_id:
-        g = LineGroup.query.filter_by(line_group_id=group_id, is_active=True).first()
-        if g:
-            allowed = True
-    return allowed
+        _get_acl_cache().delete(("group", group_id))
+        _acl_stamp.bump()
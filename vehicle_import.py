@@ -0,0 +1,227 @@
+import csv
+import io
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from models import db, Vehicle
+from plate_search import normalize_plate
+from dbutil import upsert_stmt
+
+REQUIRED_COLUMNS = {"license_plate", "brand", "model", "owner_name", "contact_info"}
+OPTIONAL_COLUMNS = ("color", "vin")
+TEXT_COLUMNS = ("license_plate", "brand", "model", "owner_name", "contact_info", "color", "vin")
+
+# โหมดอัปโหลด: เพิ่มต่อท้าย / upsert ตามทะเบียน / upsert ตามทะเบียน+เลขตัวถัง
+MODES = ("append", "upsert_plate", "upsert_plate_vin")
+
+# เก็บรายละเอียดแถวที่ถูกปฏิเสธไว้แค่บางส่วน เพื่อไม่ให้หน่วยความจำโตตามไฟล์
+MAX_REJECT_DETAILS = 100
+
+
+class CSVHeaderError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0  # คีย์ซ้ำภายในไฟล์ (แถวหลังทับแถวก่อน)
+    rejected: int = 0
+    rejected_lines: list = field(default_factory=list)  # [(เลขบรรทัด, เหตุผล), ...]
+    chunks: int = 0
+    error: str | None = None       # อ่านไฟล์ต่อไม่ได้กลางทาง (แถวก่อนหน้าบันทึกไปแล้ว)
+    error_line: int | None = None
+
+    def reject(self, line_no: int, reason: str):
+        self.rejected += 1
+        if len(self.rejected_lines) < MAX_REJECT_DETAILS:
+            self.rejected_lines.append((line_no, reason))
+
+
+def _max_len(col: str) -> int | None:
+    return getattr(Vehicle.__table__.c[col].type, "length", None)
+
+
+_LIMITS = {c: _max_len(c) for c in TEXT_COLUMNS}
+
+
+def parse_vehicle_row(row: dict, cols: set) -> tuple[dict | None, str | None]:
+    """แปลงแถว CSV เป็น dict สำหรับ INSERT; คืน (None, เหตุผล) ถ้าแถวใช้ไม่ได้"""
+    values = {}
+    for c in TEXT_COLUMNS:
+        if c in OPTIONAL_COLUMNS and c not in cols:
+            values[c] = None
+            continue
+        v = (row.get(c) or "").strip()
+        limit = _LIMITS[c]
+        if limit and len(v) > limit:
+            return None, f"{c} ยาวเกิน {limit} ตัวอักษร"
+        values[c] = v
+
+    if not values["license_plate"]:
+        return None, "ไม่มีทะเบียน"
+
+    rd_text = (row.get("recorded_date") or "").strip()
+    rec_date = None
+    if rd_text:
+        try:
+            rec_date = datetime.strptime(rd_text, "%Y-%m-%d").date()
+        except ValueError:
+            return None, f"recorded_date ไม่ถูกต้อง: {rd_text[:20]}"
+
+    now = datetime.utcnow()
+    values["plate_key"] = normalize_plate(values["license_plate"]) or None
+    values["recorded_date"] = rec_date
+    values["created_at"] = now
+    values["updated_at"] = now
+    return values, None
+
+
+def make_dedupe_key(plate_key: str | None, vin: str | None, with_vin: bool) -> str | None:
+    if not plate_key:
+        return None
+    if with_vin:
+        return f"{plate_key}|{(vin or '').strip().upper()}"
+    return plate_key
+
+
+def open_csv(binary_stream):
+    """อ่าน CSV แบบสตรีม (ถอดรหัสทีละส่วน ไม่อ่านทั้งไฟล์เข้าหน่วยความจำ)"""
+    text = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    cols = {c.strip() for c in (reader.fieldnames or [])}
+    if not (cols >= REQUIRED_COLUMNS):
+        raise CSVHeaderError("missing required columns")
+    return reader, cols
+
+
+def _insert_chunk(rows: list[tuple[int, dict]], result: ImportResult):
+    try:
+        db.session.execute(insert(Vehicle), [r for _, r in rows])
+        db.session.commit()
+        result.inserted += len(rows)
+    except Exception:
+        db.session.rollback()
+        # ทั้งก้อนล้ม -> ลองทีละแถวเพื่อแยกแถวที่มีปัญหา
+        for line_no, r in rows:
+            try:
+                db.session.execute(insert(Vehicle), [r])
+                db.session.commit()
+                result.inserted += 1
+            except Exception as e:
+                db.session.rollback()
+                result.reject(line_no, f"บันทึกไม่สำเร็จ: {type(e).__name__}")
+    result.chunks += 1
+
+
+def _upsert_chunk(rows: list[tuple[int, dict]], result: ImportResult, compare_cols: list[str]):
+    # คีย์ซ้ำในก้อนเดียวกัน: ใช้แถวหลังสุด
+    by_key: dict[str, tuple[int, dict]] = {}
+    for line_no, r in rows:
+        if r["dedupe_key"] in by_key:
+            result.duplicates += 1
+        by_key[r["dedupe_key"]] = (line_no, r)
+
+    # อ่านค่าปัจจุบันของคีย์ในก้อนนี้ด้วย query เดียว (ผ่าน unique index)
+    t = Vehicle.__table__
+    existing = {
+        row.dedupe_key: row
+        for row in db.session.execute(
+            select(t.c.dedupe_key, *[t.c[c] for c in compare_cols]).where(t.c.dedupe_key.in_(list(by_key)))
+        )
+    }
+
+    to_write = []
+    for key, (line_no, r) in by_key.items():
+        cur = existing.get(key)
+        if cur is not None and all(getattr(cur, c) == r[c] for c in compare_cols):
+            result.unchanged += 1  # ไม่เปลี่ยน -> ไม่เขียน
+            continue
+        to_write.append((line_no, r, cur is None))
+
+    if to_write:
+        update_cols = compare_cols + ["updated_at"]
+        stmt = upsert_stmt(t, ["dedupe_key"], lambda new: {c: new[c] for c in update_cols})
+        try:
+            db.session.execute(stmt, [r for _, r, _ in to_write])
+            db.session.commit()
+            written = to_write
+        except Exception:
+            db.session.rollback()
+            # ทั้งก้อนล้ม -> ลองทีละแถวเพื่อแยกแถวที่มีปัญหา
+            written = []
+            for line_no, r, is_new in to_write:
+                try:
+                    db.session.execute(stmt, [r])
+                    db.session.commit()
+                    written.append((line_no, r, is_new))
+                except Exception as e:
+                    db.session.rollback()
+                    result.reject(line_no, f"บันทึกไม่สำเร็จ: {type(e).__name__}")
+        for _, _, is_new in written:
+            if is_new:
+                result.inserted += 1
+            else:
+                result.updated += 1
+    result.chunks += 1
+
+
+def import_vehicles_csv(binary_stream, chunk_size: int = 1000, mode: str = "append") -> ImportResult:
+    """
+    นำเข้ารถจาก CSV แบบสตรีม: เขียน (Core) เป็นชุดละ chunk_size แถว และ commit ทุกชุด
+    หน่วยความจำคงที่ไม่ว่าไฟล์จะใหญ่แค่ไหน
+    mode="upsert_plate" / "upsert_plate_vin": อัปเดตแถวเดิมที่คีย์ตรงกัน (ON CONFLICT / ON DUPLICATE KEY)
+    แถวที่ค่าไม่เปลี่ยนจะถูกข้ามโดยไม่เขียน
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown import mode: {mode}")
+    reader, cols = open_csv(binary_stream)
+    result = ImportResult()
+
+    upsert = mode != "append"
+    with_vin = mode == "upsert_plate_vin"
+    # upsert อัปเดตเฉพาะคอลัมน์ที่มีในไฟล์
+    compare_cols = ["license_plate", "plate_key", "brand", "model", "owner_name", "contact_info"]
+    compare_cols += [c for c in OPTIONAL_COLUMNS if c in cols]
+    if "recorded_date" in cols:
+        compare_cols.append("recorded_date")
+
+    chunk: list[tuple[int, dict]] = []
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except (UnicodeDecodeError, csv.Error) as e:
+            # ไฟล์เสียกลางทาง: หยุดอ่าน แต่บันทึกแถวที่อ่านได้แล้วและรายงานยอดบางส่วน
+            result.error_line = reader.line_num + 1
+            result.error = "ไฟล์ต้องเข้ารหัสแบบ UTF-8" if isinstance(e, UnicodeDecodeError) else f"CSV ไม่ถูกต้อง: {e}"
+            break
+        values, reason = parse_vehicle_row(row, cols)
+        if values is None:
+            result.reject(reader.line_num, reason)
+            continue
+        if upsert:
+            values["dedupe_key"] = make_dedupe_key(values["plate_key"], values["vin"], with_vin)
+            if values["dedupe_key"] is None:
+                # ทะเบียนที่ normalize แล้วว่าง (เช่น "-" หรือ ".") ไม่มีคีย์ให้ unique index จับคู่
+                # ถ้าปล่อยเพิ่มเข้าไป การอัปโหลดไฟล์เดิมซ้ำจะได้แถวใหม่ทุกครั้ง
+                result.reject(reader.line_num, "ทะเบียนไม่มีตัวอักษร/ตัวเลข ใช้อัปเดตแบบ upsert ไม่ได้")
+                continue
+        chunk.append((reader.line_num, values))
+        if len(chunk) >= chunk_size:
+            if upsert:
+                _upsert_chunk(chunk, result, compare_cols)
+            else:
+                _insert_chunk(chunk, result)
+            chunk = []
+    if chunk:
+        if upsert:
+            _upsert_chunk(chunk, result, compare_cols)
+        else:
+            _insert_chunk(chunk, result)
+    return result